@@ -5,16 +5,25 @@ Login contra LDAP / Active Directory (misma configuración base que EmilIA).
 """
 from __future__ import annotations
 
-import json
+import hashlib
+import hmac
 import logging
+import math
 import os
 import secrets
 import subprocess
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 
-from flask import Flask, jsonify, redirect, render_template_string, request, session
+from flask import Flask, g, jsonify, redirect, render_template_string, request, session
 
 import ldap_auth
+from ldap_executor import BoundedExecutor, LDAPBusyError
+from login_throttle import LoginThrottle
+from metrics import exposition, observe_request, timed
+from provisioning import ProvisioningQueue
+from signed_tokens import TokenSigner, is_signed, parse_keyring
+from token_store import DEFAULT_DB_PATH, TokenStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,6 +37,61 @@ app.config["SESSION_COOKIE_HTTPONLY"] = True
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 
 TOKENS_FILE = "/app/users_data/tokens.json"
+JUPYTER_TOKENS_FILE = "/home/jovyan/.jupyter/tokens.json"
+TOKEN_LIFETIME = timedelta(days=30)
+# Al preparar a un usuario solo se emite token nuevo si al vigente le queda menos que esto
+TOKEN_RENEW_BEFORE = timedelta(days=float(os.getenv("TOKEN_RENEW_DAYS", "15")))
+
+# Tokens en SQLite (TOKENS_DB); tokens.json queda como exportación para JupyterLab
+# (TOKENS_JSON_EXPORT=0 la desactiva) y se importa la primera vez
+_TOKENS = TokenStore(
+    os.getenv("TOKENS_DB", DEFAULT_DB_PATH).strip(),
+    legacy_json=TOKENS_FILE,
+    export_paths=(
+        (TOKENS_FILE, JUPYTER_TOKENS_FILE)
+        if os.getenv("TOKENS_JSON_EXPORT", "1").strip() == "1" else ()
+    ),
+    revocation_refresh=float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "30")),
+)
+_TOKEN_SWEEP_SECONDS = float(os.getenv("TOKEN_SWEEP_SECONDS", "3600"))
+
+
+def _token_keyring() -> dict[str, bytes]:
+    keys = parse_keyring(os.getenv("TOKEN_SIGNING_KEYS", ""))
+    if keys:
+        return keys
+    # Sin llavero, una clave derivada de SECRET_KEY (rotarla invalida todos los tokens firmados)
+    derived = hmac.new(app.secret_key.encode("utf-8"), b"pe-ctic-jupyter-token", hashlib.sha256).hexdigest()
+    return {"s0": derived.encode("ascii")}
+
+
+# TOKEN_FORMAT=signed emite tokens firmados (usuario y caducidad dentro) que
+# /api/verify-token comprueba sin leer el almacén; los firmados se aceptan siempre.
+# La lista de revocados es la del almacén (releída cada TOKEN_REVOCATION_REFRESH_SECONDS)
+_TOKEN_FORMAT = os.getenv("TOKEN_FORMAT", "opaque").strip().lower()
+_TOKEN_SIGNER = TokenSigner(_token_keyring(), _TOKENS.revoked)
+
+# Intentos fallidos: tras LOGIN_FREE_FAILURES fallos por usuario o IP, espera creciente
+# (desde LOGIN_BACKOFF_SECONDS hasta LOGIN_BACKOFF_MAX_SECONDS) sin consultar LDAP
+_LOGIN_THROTTLE = LoginThrottle(
+    free_failures=int(os.getenv("LOGIN_FREE_FAILURES", "3")),
+    base_delay=float(os.getenv("LOGIN_BACKOFF_SECONDS", "2")),
+    max_delay=float(os.getenv("LOGIN_BACKOFF_MAX_SECONDS", "300")),
+    negative_ttl=float(os.getenv("LOGIN_NEGATIVE_CACHE_SECONDS", "300")),
+)
+
+# Logins contra LDAP en hilos aparte: LDAP_MAX_CONCURRENT a la vez, LDAP_QUEUE_LIMIT en
+# espera (el resto recibe 503 al momento) y LDAP_LOGIN_TIMEOUT segundos como máximo.
+# Con gunicorn, workers + cola debe quedar por debajo de AUTH_THREADS
+_LDAP_EXECUTOR = BoundedExecutor(
+    workers=int(os.getenv("LDAP_MAX_CONCURRENT", "4")),
+    queue=int(os.getenv("LDAP_QUEUE_LIMIT", "2")),
+    timeout=float(os.getenv("LDAP_LOGIN_TIMEOUT", "20")),
+)
+
+# Segundos que nginx reutiliza una verificación de sesión correcta (0 = no cachear).
+# Es también lo que puede seguir valiendo una cookie tras /logout si alguien la reutiliza.
+_VERIFY_CACHE_SECONDS = max(0, int(os.getenv("AUTH_VERIFY_CACHE_SECONDS", "30")))
 
 # Nombres cortos LDAP (sin dominio), separados por comas — acceso a /admin
 def _admin_usernames() -> set[str]:
@@ -96,48 +160,39 @@ PE-CTIC - Píldoras de Estadística de CTIC
             logger.warning("Fallback subprocess directorio usuario: %s", exc2)
 
 
-def load_tokens() -> dict:
-    ensure_directory(TOKENS_FILE)
-    if os.path.exists(TOKENS_FILE):
-        try:
-            with open(TOKENS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (OSError, json.JSONDecodeError) as e:
-            logger.error("Error cargando tokens: %s", e)
-    return {}
+def generate_token(username: str) -> str:
+    lifetime = TOKEN_LIFETIME.total_seconds()
+    with timed("token_io"):
+        if _TOKEN_FORMAT == "signed":
+            # También se guarda: tokens.json y la renovación siguen viendo el token
+            token = _TOKEN_SIGNER.issue(username, lifetime)
+            expires = _TOKEN_SIGNER.decode(token).expires_at
+            return _TOKENS.issue(username, lifetime, token=token, expires_at=expires)
+        return _TOKENS.issue(username, lifetime)
 
 
-def save_tokens(tokens: dict) -> None:
-    ensure_directory(TOKENS_FILE)
-    try:
-        with open(TOKENS_FILE, "w", encoding="utf-8") as f:
-            json.dump(tokens, f, indent=2)
-        os.chmod(TOKENS_FILE, 0o644)
-    except OSError as e:
-        logger.error("Error guardando tokens: %s", e)
-        raise
-    jupyter_tokens_path = "/home/jovyan/.jupyter/tokens.json"
-    try:
-        ensure_directory(jupyter_tokens_path)
-        with open(jupyter_tokens_path, "w", encoding="utf-8") as f:
-            json.dump(tokens, f, indent=2)
-        os.chmod(jupyter_tokens_path, 0o644)
-    except OSError as e:
-        logger.debug(
-            "No se escribió tokens en Jupyter (normal en contenedor auth solo): %s", e
-        )
+def ensure_token(username: str) -> None:
+    """Emite un token si el usuario no tiene ninguno vigente durante ``TOKEN_RENEW_BEFORE``."""
+    with timed("token_io"):
+        expires = _TOKENS.latest_expiry(username)
+    if expires is None or expires - time.time() < TOKEN_RENEW_BEFORE.total_seconds():
+        generate_token(username)
 
 
-def generate_token(username: str) -> str:
-    tokens = load_tokens()
-    token = secrets.token_urlsafe(32)
-    tokens[token] = {
-        "username": username,
-        "created": datetime.now().isoformat(),
-        "expires": (datetime.now() + timedelta(days=30)).isoformat(),
-    }
-    save_tokens(tokens)
-    return token
+def provision_user(username: str) -> None:
+    """Directorio personal y token de JupyterLab (idempotente; en segundo plano)."""
+    with timed("provision"):
+        ensure_user_workspace(username)
+        ensure_token(username)
+
+
+# Los logins encolan la preparación del usuario; los ya preparados se recuerdan
+# PROVISION_CACHE_SECONDS y no se vuelven a encolar
+_PROVISIONING = ProvisioningQueue(
+    provision_user,
+    workers=int(os.getenv("PROVISION_WORKERS", "1")),
+    ttl=float(os.getenv("PROVISION_CACHE_SECONDS", "3600")),
+)
 
 
 # --- Plantillas HTML (mismo aspecto Bootstrap que antes) ---
@@ -196,7 +251,7 @@ LOGIN_FAIL_HTML = """
                     <div class="card shadow">
                         <div class="card-body p-5">
                             <h2 class="text-center mb-4">PE-CTIC</h2>
-                            <div class="alert alert-danger">Usuario o contraseña incorrectos</div>
+                            <div class="alert alert-danger">{{ message }}</div>
                             <form method="POST" action="login">
                                 <div class="mb-3">
                                     <label class="form-label">Usuario</label>
@@ -251,6 +306,27 @@ SESSION_EXPIRED_HTML = """
     """
 
 
+@app.before_request
+def _start_request_timer() -> None:
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def _start_token_sweeper() -> None:
+    # En el proceso que atiende peticiones (no en el vigilante del recargador de Flask)
+    _TOKENS.start_sweeper(_TOKEN_SWEEP_SECONDS)
+
+
+@app.after_request
+def _observe_request(response):
+    """Latencia por regla de ruta (no por URL, para acotar las series)."""
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "<sin ruta>"
+        observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
 @app.route("/")
 def index():
     if "username" in session:
@@ -269,21 +345,45 @@ def login():
             logger.error("LDAP no configurado")
             return "Error de configuración del servidor (LDAP).", 503
 
+        client_ip = request.headers.get("X-Real-IP") or request.remote_addr or ""
+        wait = _LOGIN_THROTTLE.retry_after(username, client_ip)
+        if wait > 0:
+            seconds = math.ceil(wait)
+            logger.info("Login frenado: %s desde %s (%d s)", username, client_ip, seconds)
+            return (
+                render_template_string(
+                    LOGIN_FAIL_HTML,
+                    message=f"Demasiados intentos fallidos. Espera {seconds} s y vuelve a intentarlo.",
+                ),
+                429,
+                {"Retry-After": str(seconds)},
+            )
+
         try:
-            profile = ldap_auth.ldap_authenticate_and_profile(username, password)
+            if _LOGIN_THROTTLE.known_bad(username, password):
+                # La misma contraseña acaba de fallar: no se vuelve a probar contra AD
+                raise ValueError("Credenciales incorrectas (caché)")
+            profile = _LDAP_EXECUTOR.run(ldap_auth.ldap_authenticate_and_profile, username, password)
         except ValueError:
             logger.info("Login LDAP rechazado: %s", username)
-            return render_template_string(LOGIN_FAIL_HTML), 401
+            _LOGIN_THROTTLE.failure(username, client_ip, password)
+            return render_template_string(LOGIN_FAIL_HTML, message="Usuario o contraseña incorrectos"), 401
+        except LDAPBusyError:
+            logger.warning("Login rechazado por saturación de LDAP: %s", username)
+            return "Hay demasiados inicios de sesión en curso. Inténtalo de nuevo en unos segundos.", 503, {
+                "Retry-After": "5"
+            }
         except RuntimeError as exc:
             logger.exception("LDAP error: %s", exc)
             return f"Error de conexión con el directorio: {exc}", 503
 
         uname = profile["username"]
+        _LOGIN_THROTTLE.success(uname)
         session["username"] = uname
         session["is_admin"] = user_is_admin(uname)
         session.permanent = True
-        ensure_user_workspace(uname)
-        generate_token(uname)
+        # Directorio y token fuera de la petición: el login solo espera al bind
+        _PROVISIONING.submit(uname)
         logger.info("Login LDAP OK: %s (admin=%s)", uname, session["is_admin"])
         return redirect("/lab")
 
@@ -294,6 +394,9 @@ def login():
 
 @app.route("/logout")
 def logout():
+    # La sesión vive en la cookie firmada: tras session.clear() el navegador la
+    # sustituye y deja de coincidir con la entrada de la caché de nginx, que caduca
+    # sola en AUTH_VERIFY_CACHE_SECONDS
     if "username" in session:
         logger.info("Logout: %s", session["username"])
         session.clear()
@@ -302,30 +405,58 @@ def logout():
 
 @app.route("/api/verify-session", methods=["GET"])
 def verify_session():
+    """Verificación de nginx (auth_request) antes de cada petición a JupyterLab.
+
+    nginx cachea la respuesta afirmativa por cookie de sesión durante
+    ``X-Accel-Expires`` segundos; las negativas no se cachean.
+    """
     try:
         if "username" in session:
             response = app.response_class("", status=200)
             response.headers["X-User"] = session.get("username", "")
+            response.headers["X-Accel-Expires"] = str(_VERIFY_CACHE_SECONDS)
             return response
-        return "", 401
+        return "", 401, {"X-Accel-Expires": "0"}
     except Exception as e:
         logger.error("verify-session: %s", e)
-        return "", 401
+        return "", 401, {"X-Accel-Expires": "0"}
 
 
 @app.route("/api/verify-token", methods=["POST"])
 def verify_token():
     data = request.json or {}
     token = data.get("token", "")
-    tokens = load_tokens()
-    if token in tokens:
-        token_info = tokens[token]
-        expires = datetime.fromisoformat(token_info["expires"])
-        if datetime.now() < expires:
-            return jsonify({"valid": True, "username": token_info["username"]})
+    if is_signed(token):
+        # Solo firma, caducidad y lista de revocados en memoria
+        username = _TOKEN_SIGNER.verify(token)
+    else:
+        with timed("token_io"):
+            username = _TOKENS.lookup(token)
+    if username is not None:
+        return jsonify({"valid": True, "username": username})
     return jsonify({"valid": False}), 401
 
 
+@app.route("/api/tokens/revoke", methods=["POST"])
+def revoke_token():
+    """Revoca un token de JupyterLab (solo administradores)."""
+    if "username" not in session or not session.get("is_admin"):
+        return jsonify({"error": "No autorizado"}), 403
+    data = request.json or {}
+    token = data.get("token", "")
+    if is_signed(token):
+        claims = _TOKEN_SIGNER.decode(token)
+        if claims is None:
+            return jsonify({"error": "Token no válido"}), 400
+        _TOKENS.revoke_id(claims.jti, claims.expires_at)
+        _TOKENS.revoke(token)
+        revoked = True
+    else:
+        revoked = _TOKENS.revoke(token)
+    logger.info("Token revocado por %s (encontrado=%s)", session["username"], revoked)
+    return jsonify({"revoked": revoked})
+
+
 @app.route("/api/users", methods=["GET"])
 def list_users():
     """Ya no hay usuarios locales; la tabla admin queda vacía o solo informativa."""
@@ -372,6 +503,19 @@ def delete_user(username):
     )
 
 
+@app.route("/metrics")
+def metrics():
+    """Métricas en formato Prometheus, solo para la red interna.
+
+    nginx no publica esta ruta; si aun así llega una petición reenviada por el
+    proxy (con ``X-Forwarded-For``), se responde como si no existiera.
+    """
+    if request.headers.get("X-Forwarded-For"):
+        return "Not Found", 404
+    body, content_type = exposition()
+    return app.response_class(body, content_type=content_type)
+
+
 @app.route("/session-expired")
 def session_expired():
     return render_template_string(SESSION_EXPIRED_HTML)
@@ -384,4 +528,5 @@ if __name__ == "__main__":
             "LDAP_* no definidos; se usan valores por defecto (Castor / fundacionctic.org)."
         )
     logger.info("Servicio de autenticación PE-CTIC (LDAP) iniciado")
+    # Solo para desarrollo: en el contenedor se sirve con gunicorn (gunicorn.conf.py)
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,11 @@
+"""
+Pruebas de rendimiento del servicio de autenticación, sin LDAP real.
+
+Se ejecutan desde ``auth/``::
+
+    python -m benchmarks --logins 8 --ldap-delay 2 --output resultados.json
+
+El resultado es un JSON con el entorno y, para cada escenario, las
+estadísticas de tiempo de ``/api/verify-session`` (media, percentiles, mínimo
+y máximo en ms) y los estados HTTP de los logins lanzados en paralelo.
+"""
@@ -0,0 +1,267 @@
+"""
+Mide la latencia de ``/api/verify-session`` mientras hay logins en curso.
+
+El directorio LDAP se sustituye por una función que tarda ``--ldap-delay``
+segundos y el servicio se sirve con gunicorn (la misma configuración de hilos
+que en el contenedor). Escenarios:
+
+- ``reposo``: solo verificaciones.
+- ``logins_mismo_servicio``: verificaciones y logins al mismo servicio, como
+  cuando nginx lo envía todo a ``auth``.
+- ``logins_servicio_aparte``: las verificaciones van a otro servicio (el
+  ``auth-verify`` de docker-compose) y los logins a ``auth``.
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from importlib import metadata
+from urllib.parse import urlencode
+
+
+def _stats(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(0.50) * 1000, 3),
+        "p95_ms": round(percentile(0.95) * 1000, 3),
+        "p99_ms": round(percentile(0.99) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=8, help="Clientes que hacen login sin parar")
+    parser.add_argument("--ldap-delay", type=float, default=2.0,
+                        help="Segundos que tarda cada consulta al LDAP simulado")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duración de cada escenario")
+    parser.add_argument("--verify-clients", type=int, default=4,
+                        help="Clientes que verifican sesiones en paralelo (como los workers de nginx)")
+    parser.add_argument("--workers", type=int, default=2, help="Procesos de gunicorn de cada servicio")
+    parser.add_argument("--threads", type=int, default=8, help="Hilos por proceso")
+    parser.add_argument("--output", help="Fichero JSON de salida (por defecto, stdout)")
+    return parser.parse_args(argv)
+
+
+def _configure_environment(data_dir: str) -> None:
+    """Variables que lee app.py al importarse: tokens en un directorio temporal y sin hilos de fondo."""
+    os.environ["TOKENS_DB"] = os.path.join(data_dir, "tokens.sqlite3")
+    os.environ["TOKENS_JSON_EXPORT"] = "0"
+    os.environ["TOKEN_SWEEP_SECONDS"] = "0"
+    # Todos los logins llegan desde la misma IP y con la misma contraseña
+    os.environ["LOGIN_FREE_FAILURES"] = "1000000"
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+def _load_app(ldap_delay: float):
+    import app as auth_app
+
+    def fake_authenticate(username: str, password: str) -> dict:
+        time.sleep(ldap_delay)
+        return {"username": username, "first_name": "", "last_name": "", "email": ""}
+
+    auth_app.ldap_auth.ldap_authenticate_and_profile = fake_authenticate
+    # El directorio personal vive en /app/users del contenedor
+    auth_app.ensure_user_workspace = lambda username: None
+    return auth_app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(wsgi_app, port: int, workers: int, threads: int) -> None:
+    """gunicorn en este proceso (hijo), con la app ya cargada y parcheada."""
+    from gunicorn.app.base import BaseApplication
+
+    class _Server(BaseApplication):
+        def load_config(self) -> None:
+            self.cfg.set("bind", f"127.0.0.1:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("keepalive", 75)
+            self.cfg.set("timeout", 120)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            return wsgi_app
+
+    _Server().run()
+
+
+def _start_server(wsgi_app, args: argparse.Namespace) -> tuple[multiprocessing.Process, int]:
+    port = _free_port()
+    process = multiprocessing.get_context("fork").Process(
+        target=_serve, args=(wsgi_app, port, args.workers, args.threads), daemon=True
+    )
+    process.start()
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"gunicorn no arrancó en el puerto {port}")
+
+
+def _verify_loop(port: int, cookie: str, stop: threading.Event, samples: list[float], errors: Counter) -> None:
+    # Conexión keep-alive, como el upstream de nginx
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Cookie": f"session={cookie}"}
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn.request("GET", "/api/verify-session", headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors["conexion"] += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            continue
+        samples.append(time.perf_counter() - start)
+        if response.status != 200:
+            errors[str(response.status)] += 1
+    conn.close()
+
+
+def _login_loop(port: int, index: int, stop: threading.Event, statuses: Counter) -> None:
+    body = urlencode({"username": f"bench{index}", "password": "x"})
+    headers = {"Content-Type": "application/x-www-form-urlencoded", "Connection": "close"}
+    while not stop.is_set():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        try:
+            conn.request("POST", "/login", body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            statuses[str(response.status)] += 1
+            if response.status == 503:
+                # Lo que haría un usuario ante "inténtalo en unos segundos", sin martillear
+                stop.wait(0.5)
+        except (OSError, http.client.HTTPException):
+            statuses["conexion"] += 1
+        finally:
+            conn.close()
+
+
+def _scenario(verify_port: int, login_port: int | None, cookie: str, args: argparse.Namespace) -> dict:
+    stop = threading.Event()
+    samples: list[float] = []
+    errors: Counter = Counter()
+    statuses: Counter = Counter()
+    threads = []
+    if login_port is not None:
+        threads += [
+            threading.Thread(target=_login_loop, args=(login_port, i, stop, statuses), daemon=True)
+            for i in range(args.logins)
+        ]
+    # Los logins empiezan antes para que el servicio ya esté ocupado al medir
+    for thread in threads:
+        thread.start()
+    if threads:
+        time.sleep(min(1.0, args.ldap_delay / 2))
+    verifiers = [
+        threading.Thread(target=_verify_loop, args=(verify_port, cookie, stop, samples, errors), daemon=True)
+        for _ in range(args.verify_clients)
+    ]
+    for thread in verifiers:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in verifiers + threads:
+        thread.join()
+    result = _stats(samples) if samples else {"n": 0}
+    result["verify_errors"] = dict(errors)
+    if login_port is not None:
+        result["login_status"] = dict(statuses)
+    return result
+
+
+def run(args: argparse.Namespace, data_dir: str) -> dict:
+    _configure_environment(data_dir)
+    auth_app = _load_app(args.ldap_delay)
+    import gunicorn
+
+    cookie = auth_app.app.session_interface.get_signing_serializer(auth_app.app).dumps(
+        {"username": "bench", "is_admin": False, "_permanent": True}
+    )
+
+    results: dict[str, dict] = {}
+    auth_server, auth_port = _start_server(auth_app.app, args)
+    verify_server, verify_port = _start_server(auth_app.app, args)
+    try:
+        results["reposo"] = _scenario(auth_port, None, cookie, args)
+        results["logins_mismo_servicio"] = _scenario(auth_port, auth_port, cookie, args)
+        results["logins_servicio_aparte"] = _scenario(verify_port, auth_port, cookie, args)
+    finally:
+        for process in (auth_server, verify_server):
+            process.terminate()
+            process.join(10)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "flask": metadata.version("flask"),
+            "gunicorn": gunicorn.__version__,
+        },
+        "config": {
+            "logins": args.logins,
+            "ldap_delay_s": args.ldap_delay,
+            "seconds": args.seconds,
+            "verify_clients": args.verify_clients,
+            "workers": args.workers,
+            "threads": args.threads,
+            "ldap_max_concurrent": auth_app._LDAP_EXECUTOR.workers,
+            "ldap_queue_limit": auth_app._LDAP_EXECUTOR.queue,
+        },
+        "results": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    data_dir = tempfile.mkdtemp(prefix="pe-ctic-auth-bench-")
+    try:
+        report = run(args, data_dir)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
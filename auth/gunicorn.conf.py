@@ -0,0 +1,51 @@
+# auth/gunicorn.conf.py
+"""
+Configuración de gunicorn para el servicio de autenticación.
+
+Hilos (``gthread``) en lugar del servidor de desarrollo de Flask: un login
+esperando a LDAP ocupa un hilo, no el proceso. Las operaciones LDAP van además
+a un pool propio con cola limitada (``LDAP_MAX_CONCURRENT`` +
+``LDAP_QUEUE_LIMIT``, ver ldap_executor.py), de modo que siempre quedan hilos
+libres para el resto de peticiones.
+
+El mismo contenedor sirve el camino rápido (servicio ``auth-verify`` de
+docker-compose): solo recibe ``/api/verify-session`` y ``/api/verify-token``,
+nunca un login, y mantiene conexiones keep-alive con nginx.
+
+Las métricas de Prometheus de todos los workers se agregan a través de
+``PROMETHEUS_MULTIPROC_DIR``, que debe fijarse antes de importar la app.
+"""
+import os
+import shutil
+
+_METRICS_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/auth-metrics")
+# Se vacía al arrancar el maestro y no en cada HUP (que vuelve a leer este fichero)
+if os.environ.get("AUTH_METRICS_MASTER_PID") != str(os.getpid()):
+    os.environ["AUTH_METRICS_MASTER_PID"] = str(os.getpid())
+    shutil.rmtree(_METRICS_DIR, ignore_errors=True)
+    os.makedirs(_METRICS_DIR, exist_ok=True)
+
+bind = os.getenv("AUTH_BIND", "0.0.0.0:5000")
+
+# El estado de los intentos fallidos (login_throttle.py) es de cada proceso:
+# pocos procesos y muchos hilos
+workers = int(os.getenv("AUTH_WORKERS", "2"))
+threads = int(os.getenv("AUTH_THREADS", "8"))
+worker_class = "gthread"
+
+# Un login espera como mucho LDAP_LOGIN_TIMEOUT (20 s por defecto)
+timeout = int(os.getenv("AUTH_TIMEOUT", "60"))
+graceful_timeout = 30
+# Mayor que el keepalive_timeout del upstream en nginx: la conexión la cierra nginx
+keepalive = int(os.getenv("AUTH_KEEPALIVE", "75"))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("AUTH_LOG_LEVEL", "info")
+
+
+def child_exit(server, worker):
+    """Los valores de los workers que ya no existen dejan de contar en los gauges."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -6,10 +6,14 @@ import logging
 import os
 from typing import Any
 
-from ldap3 import ALL, SUBTREE, Connection, Server
-from ldap3.core.exceptions import LDAPBindError, LDAPException
+from ldap3 import SUBTREE, Connection
+from ldap3.core.exceptions import LDAPException
 from ldap3.utils.conv import escape_filter_chars
 
+from ldap_pool import ConnectionPool, build_server_pool
+from metrics import timed
+from ttl_cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
 _DEFAULT_LDAP_URI = "ldap://castor.fundacionctic.org:3268"
@@ -31,6 +35,64 @@ LDAP_USER_UPN_SUFFIX = _env_or_default("LDAP_USER_UPN_SUFFIX", _DEFAULT_UPN_SUFF
 _sf = os.getenv("LDAP_USER_SEARCH_FILTER", "").strip()
 LDAP_USER_SEARCH_FILTER = _sf if _sf else "(userPrincipalName={upn})"
 
+# Varias URIs (comas o espacios) = failover en ese orden; LDAP_SERVER_ROUND_ROBIN=1 reparte
+LDAP_CONNECT_TIMEOUT = int(os.getenv("LDAP_CONNECT_TIMEOUT", "5"))
+LDAP_RECEIVE_TIMEOUT = int(os.getenv("LDAP_RECEIVE_TIMEOUT", "10"))
+LDAP_SERVER_RETRY_SECONDS = int(os.getenv("LDAP_SERVER_RETRY_SECONDS", "60"))
+LDAP_POOL_SIZE = int(os.getenv("LDAP_POOL_SIZE", "8"))
+LDAP_POOL_IDLE_SECONDS = float(os.getenv("LDAP_POOL_IDLE_SECONDS", "240"))
+# Cuenta de servicio opcional para la búsqueda de atributos: la conexión del
+# usuario vuelve al pool nada más validar la contraseña
+LDAP_BIND_DN = os.getenv("LDAP_BIND_DN", "").strip()
+LDAP_BIND_PASSWORD = os.getenv("LDAP_BIND_PASSWORD", "")
+
+_ATTRIBUTES = ["givenName", "sn", "displayName", "mail", "cn"]
+
+# Perfiles (nombre, apellidos, correo) por usuario: con el perfil en caché, un
+# login correcto es solo el bind, sin búsqueda (0 = sin caché)
+_PROFILE_CACHE: TTLCache[dict[str, Any]] = TTLCache(
+    float(os.getenv("LDAP_PROFILE_CACHE_SECONDS", "3600"))
+)
+
+_SERVER_POOL = build_server_pool(
+    LDAP_SERVER_URI,
+    connect_timeout=LDAP_CONNECT_TIMEOUT,
+    retry_seconds=LDAP_SERVER_RETRY_SECONDS,
+    round_robin=os.getenv("LDAP_SERVER_ROUND_ROBIN", "0").strip() == "1",
+)
+
+
+def _user_connection() -> Connection:
+    # Sin abrir ni autenticar: el primer rebind abre el socket
+    return Connection(
+        _SERVER_POOL,
+        receive_timeout=LDAP_RECEIVE_TIMEOUT,
+        read_only=True,
+        raise_exceptions=False,
+    )
+
+
+def _service_connection() -> Connection:
+    return Connection(
+        _SERVER_POOL,
+        user=LDAP_BIND_DN,
+        password=LDAP_BIND_PASSWORD,
+        receive_timeout=LDAP_RECEIVE_TIMEOUT,
+        read_only=True,
+        auto_bind=True,
+    )
+
+
+_USER_POOL = ConnectionPool(
+    _user_connection, size=LDAP_POOL_SIZE, idle_seconds=LDAP_POOL_IDLE_SECONDS, name="usuarios"
+)
+_SERVICE_POOL = (
+    ConnectionPool(
+        _service_connection, size=LDAP_POOL_SIZE, idle_seconds=LDAP_POOL_IDLE_SECONDS, name="servicio"
+    )
+    if LDAP_BIND_DN else None
+)
+
 
 def ldap_configured() -> bool:
     return bool(LDAP_SERVER_URI and LDAP_BASE_DN and LDAP_USER_UPN_SUFFIX)
@@ -67,11 +129,35 @@ def ldap_authenticate_and_profile(username: str, password: str) -> dict[str, Any
         upn=escape_filter_chars(upn),
     )
 
-    server = Server(LDAP_SERVER_URI, get_info=ALL)
+    def search(conn: Connection) -> list:
+        with timed("ldap_search"):
+            conn.search(LDAP_BASE_DN, filt, search_scope=SUBTREE, attributes=_ATTRIBUTES)
+        return list(conn.entries)
+
+    cache_key = user_clean.casefold()
+    cached = _PROFILE_CACHE.get(cache_key)
+
+    def bind_and_search(conn: Connection) -> list | None:
+        try:
+            with timed("ldap_bind"):
+                bound = conn.rebind(upn, password, read_server_info=False)
+            if not bound:
+                return None
+            if cached is not None or _SERVICE_POOL is not None:
+                return []
+            return search(conn)
+        finally:
+            # La conexión vuelve al pool sin la contraseña de este usuario
+            conn.password = None
+
     try:
-        conn = Connection(server, user=upn, password=password, auto_bind=True)
-    except LDAPBindError as exc:
-        raise ValueError("Credenciales incorrectas") from exc
+        entries = _USER_POOL.run(bind_and_search)
+        if entries is None:
+            raise ValueError("Credenciales incorrectas")
+        if cached is not None:
+            return dict(cached, username=user_clean)
+        if _SERVICE_POOL is not None:
+            entries = _SERVICE_POOL.run(search)
     except LDAPException as exc:
         raise RuntimeError(f"LDAP: {exc}") from exc
 
@@ -79,48 +165,42 @@ def ldap_authenticate_and_profile(username: str, password: str) -> dict[str, Any
     last_name = ""
     email = ""
 
-    try:
-        conn.search(
-            LDAP_BASE_DN,
-            filt,
-            search_scope=SUBTREE,
-            attributes=["givenName", "sn", "displayName", "mail", "cn"],
+    if entries:
+        entry = entries[0]
+        mail_v = _entry_attr(entry, "mail")
+        cn_v = _entry_attr(entry, "cn")
+        sn_v = _entry_attr(entry, "sn")
+        display_v = _entry_attr(entry, "displayName")
+        given = _entry_attr(entry, "givenName")
+        logger.debug(
+            "LDAP ok user=%s mail=%s cn=%s sn=%s displayName=%s givenName=%s",
+            user_clean,
+            mail_v,
+            cn_v,
+            sn_v,
+            display_v,
+            given,
         )
-        if conn.entries:
-            entry = conn.entries[0]
-            mail_v = _entry_attr(entry, "mail")
-            cn_v = _entry_attr(entry, "cn")
-            sn_v = _entry_attr(entry, "sn")
-            display_v = _entry_attr(entry, "displayName")
-            given = _entry_attr(entry, "givenName")
-            logger.debug(
-                "LDAP ok user=%s mail=%s cn=%s sn=%s displayName=%s givenName=%s",
-                user_clean,
-                mail_v,
-                cn_v,
-                sn_v,
-                display_v,
-                given,
-            )
-            if given or sn_v:
-                name = given or user_clean
-                last_name = sn_v
-            else:
-                disp = display_v or cn_v
-                if disp:
-                    parts = disp.split(None, 1)
-                    name = parts[0]
-                    last_name = parts[1] if len(parts) > 1 else ""
-            email = mail_v
+        if given or sn_v:
+            name = given or user_clean
+            last_name = sn_v
         else:
-            logger.warning("LDAP bind OK pero sin entrada para el filtro: %s", user_clean)
-    finally:
-        conn.unbind()
-
-    return {
+            disp = display_v or cn_v
+            if disp:
+                parts = disp.split(None, 1)
+                name = parts[0]
+                last_name = parts[1] if len(parts) > 1 else ""
+        email = mail_v
+    else:
+        logger.warning("LDAP bind OK pero sin entrada para el filtro: %s", user_clean)
+
+    profile = {
         "username": user_clean,
         "name": name,
         "lastName": last_name,
         "email": email or "no email",
     }
+    if entries:
+        _PROFILE_CACHE.set(cache_key, profile)
+    return dict(profile)
 
@@ -0,0 +1,53 @@
+"""
+Hilos dedicados a las operaciones LDAP del login, con cola y espera acotadas.
+
+Un directorio lento no puede ocupar todos los hilos del servidor: como mucho
+``workers`` logins consultan LDAP a la vez y ``queue`` esperan turno. El resto
+se rechaza al momento (``LDAPBusyError``), y quien espera más de ``timeout``
+segundos recibe ``LDAPTimeoutError`` sin que el hilo de la petición siga
+bloqueado.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class LDAPBusyError(RuntimeError):
+    """Demasiados logins en curso o en cola."""
+
+
+class LDAPTimeoutError(RuntimeError):
+    """El directorio no respondió a tiempo."""
+
+
+class BoundedExecutor:
+    def __init__(self, workers: int = 4, queue: int = 2, timeout: float = 20) -> None:
+        self.workers = max(1, workers)
+        self.queue = max(0, queue)
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ldap")
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue)
+
+    def run(self, fn: Callable[..., T], *args) -> T:
+        if not self._slots.acquire(blocking=False):
+            raise LDAPBusyError("LDAP: demasiados logins simultáneos")
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # El hueco se libera cuando termina la tarea, no cuando se deja de esperar
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Si aún no había empezado, no llega a consultar el directorio
+            future.cancel()
+            raise LDAPTimeoutError(
+                f"LDAP: sin respuesta en {self.timeout:g} s"
+            ) from None
@@ -0,0 +1,129 @@
+"""
+Conexiones LDAP reutilizables para el login.
+
+Los ``Server`` y el ``ServerPool`` se crean una vez por proceso y sin
+``get_info``: el login no necesita el esquema ni el DSE del directorio, que
+antes se descargaban en cada intento. ``ConnectionPool`` mantiene sockets
+abiertos entre logins (sin repetir TCP/TLS) y limita cuántos hay a la vez.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from typing import Callable, TypeVar
+
+from ldap3 import FIRST, NONE, ROUND_ROBIN, Connection, Server, ServerPool
+from ldap3.core.exceptions import LDAPException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def build_server_pool(
+    uris: str,
+    connect_timeout: int,
+    retry_seconds: int,
+    round_robin: bool = False,
+) -> ServerPool:
+    """``ServerPool`` con una entrada por URI (separadas por comas o espacios).
+
+    Cada conexión prueba los servidores en orden (o rotando, con
+    ``round_robin``) y da una sola vuelta antes de fallar. Un servidor que no
+    responde se descarta durante ``retry_seconds``.
+    """
+    servers = [
+        Server(uri, get_info=NONE, connect_timeout=connect_timeout)
+        for uri in re.split(r"[\s,]+", uris)
+        if uri
+    ]
+    return ServerPool(
+        servers,
+        pool_strategy=ROUND_ROBIN if round_robin else FIRST,
+        active=1,
+        exhaust=retry_seconds,
+    )
+
+
+class ConnectionPool:
+    """Conexiones abiertas y reutilizables, como mucho ``size`` en uso a la vez.
+
+    ``run(operation)`` presta una conexión a ``operation``. Si una conexión
+    reutilizada falla (el servidor cerró el socket inactivo), se descarta y se
+    repite la operación una vez con otra nueva; las conexiones que fallan
+    nunca vuelven al pool.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Connection],
+        size: int = 8,
+        idle_seconds: float = 240,
+        acquire_timeout: float = 10,
+        name: str = "ldap",
+    ) -> None:
+        self._factory = factory
+        self.idle_seconds = idle_seconds
+        self.acquire_timeout = acquire_timeout
+        self.name = name
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        self._lock = threading.Lock()
+        # Pila (LIFO): se reutiliza primero la más reciente, las viejas caducan
+        self._idle: list[tuple[Connection, float]] = []
+
+    def run(self, operation: Callable[[Connection], T]) -> T:
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise RuntimeError(f"LDAP: no hay conexiones libres ({self.name})")
+        retried = False
+        try:
+            while True:
+                conn, reused = self._take()
+                try:
+                    result = operation(conn)
+                except (LDAPException, OSError):
+                    _close(conn)
+                    if not reused or retried:
+                        raise
+                    # Si el servidor cerró una, probablemente cerró todas las inactivas
+                    logger.info("Conexión LDAP reutilizada caída (%s); se reintenta", self.name)
+                    self.close()
+                    retried = True
+                    continue
+                except BaseException:
+                    self._put(conn)
+                    raise
+                self._put(conn)
+                return result
+        finally:
+            self._slots.release()
+
+    def _take(self) -> tuple[Connection, bool]:
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, since = self._idle.pop()
+                if now - since <= self.idle_seconds and not conn.closed:
+                    return conn, True
+                _close(conn)
+        return self._factory(), False
+
+    def _put(self, conn: Connection) -> None:
+        if conn.closed:
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            _close(conn)
+
+
+def _close(conn: Connection) -> None:
+    try:
+        conn.unbind()
+    except (LDAPException, OSError):
+        pass
@@ -0,0 +1,81 @@
+"""
+Freno a los intentos de login fallidos, antes de llegar a Active Directory.
+
+- Caché negativa: un usuario y contraseña que acaban de fallar se rechazan
+  sin volver a consultar el directorio (se guarda un HMAC con una clave
+  aleatoria del proceso, nunca la contraseña).
+- Espera creciente por usuario y por IP: tras ``free_failures`` fallos, cada
+  nuevo fallo duplica el tiempo durante el que se rechazan los intentos (hasta
+  ``max_delay``). Los fallos se olvidan tras ``window`` segundos sin ninguno.
+
+El estado es de cada proceso: con varios workers, el límite efectivo se
+multiplica por su número.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+
+from ttl_cache import TTLCache
+
+
+class LoginThrottle:
+    def __init__(
+        self,
+        free_failures: int = 3,
+        base_delay: float = 2,
+        max_delay: float = 300,
+        window: float = 900,
+        negative_ttl: float = 300,
+    ) -> None:
+        self.free_failures = free_failures
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        # clave ("user"/"ip", valor) -> (fallos, bloqueado hasta)
+        self._failures: TTLCache[tuple[int, float]] = TTLCache(window)
+        self._negative: TTLCache[bool] = TTLCache(negative_ttl)
+
+    def _keys(self, username: str, ip: str) -> list[tuple[str, str]]:
+        keys = [("user", username.strip().casefold())]
+        if ip:
+            keys.append(("ip", ip))
+        return keys
+
+    def _credential(self, username: str, password: str) -> bytes:
+        message = username.strip().casefold().encode("utf-8") + b"\0" + password.encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def retry_after(self, username: str, ip: str) -> float:
+        """Segundos que faltan para poder intentarlo (0 = se puede ya)."""
+        now = time.monotonic()
+        wait = 0.0
+        for key in self._keys(username, ip):
+            state = self._failures.get(key)
+            if state is not None:
+                wait = max(wait, state[1] - now)
+        return wait
+
+    def known_bad(self, username: str, password: str) -> bool:
+        """True si esta misma contraseña acaba de fallar para este usuario."""
+        return bool(self._negative.get(self._credential(username, password)))
+
+    def failure(self, username: str, ip: str, password: str) -> None:
+        self._negative.set(self._credential(username, password), True)
+        now = time.monotonic()
+        with self._lock:
+            for key in self._keys(username, ip):
+                count = (self._failures.get(key) or (0, 0.0))[0] + 1
+                blocked_until = 0.0
+                if count > self.free_failures:
+                    delay = self.base_delay * 2 ** (count - self.free_failures - 1)
+                    blocked_until = now + min(delay, self.max_delay)
+                self._failures.set(key, (count, blocked_until))
+
+    def success(self, username: str) -> None:
+        # Solo el usuario: un login correcto no debe limpiar el historial de la IP
+        self._failures.pop(("user", username.strip().casefold()))
@@ -0,0 +1,60 @@
+"""
+Métricas del servicio de autenticación en formato Prometheus (``GET /metrics``).
+
+- Latencia de las peticiones por ruta, método y estado (``/api/verify-session``
+  incluida: su ``_count`` es el número de verificaciones de nginx).
+- Duración de cada fase: ``ldap_bind``, ``ldap_search``, ``token_io``
+  (emisión y comprobación de tokens en el almacén SQLite) y ``provision``
+  (preparación del usuario en segundo plano tras el login).
+
+Con varios procesos (gunicorn), ``PROMETHEUS_MULTIPROC_DIR`` hace que cada uno
+escriba sus valores en ese directorio y ``/metrics`` los agregue.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess,
+)
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "auth_request_duration_seconds",
+    "Duración de las peticiones hasta generar la respuesta",
+    ["route", "method", "status"],
+    buckets=_BUCKETS,
+)
+PHASE_LATENCY = Histogram(
+    "auth_phase_duration_seconds",
+    "Duración de cada fase (LDAP y tokens)",
+    ["phase"],
+    buckets=_BUCKETS,
+)
+
+
+@contextmanager
+def timed(phase: str):
+    """Observa la duración del bloque en ``auth_phase_duration_seconds{phase=...}``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_LATENCY.labels(phase).observe(time.perf_counter() - start)
+
+
+def observe_request(route: str, method: str, status: int, seconds: float) -> None:
+    REQUEST_LATENCY.labels(route, method, str(status)).observe(seconds)
+
+
+def exposition() -> tuple[bytes, str]:
+    """Cuerpo y Content-Type de ``/metrics`` (agregando todos los procesos si procede)."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
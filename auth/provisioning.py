@@ -0,0 +1,90 @@
+"""
+Preparación de cada usuario tras el login, fuera de la petición.
+
+El login solo encola el nombre de usuario; uno o varios hilos ejecutan
+``provision(username)`` (directorio personal, token de JupyterLab), que debe
+ser idempotente. Un usuario ya preparado se recuerda durante ``ttl`` segundos
+y sus logins siguientes no encolan nada. Un usuario que ya está en cola no se
+encola dos veces, y si la preparación falla se vuelve a intentar en su
+siguiente login.
+
+El estado es de cada proceso: con varios workers, cada uno prepara al usuario
+una vez por ``ttl`` como mucho, lo que es inocuo por ser idempotente.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from typing import Callable
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisioningQueue:
+    """Cola FIFO sin duplicados + hilos que llaman a ``provision``."""
+
+    def __init__(
+        self,
+        provision: Callable[[str], None],
+        workers: int = 1,
+        ttl: float = 3600,
+        max_entries: int = 10000,
+    ) -> None:
+        self.provision = provision
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._queue: deque[str] = deque()
+        self._pending: set[str] = set()
+        self._done: TTLCache[bool] = TTLCache(ttl, max_entries)
+        self._threads: list[threading.Thread] = []
+        self.provisioned = 0
+        self.failed = 0
+
+    def submit(self, username: str) -> bool:
+        """Encola a ``username`` si no está preparado ni en cola; devuelve si se encoló."""
+        if self._done.get(username):
+            return False
+        with self._cond:
+            if username in self._pending:
+                return False
+            self._pending.add(username)
+            self._queue.append(username)
+            # Hilos perezosos: se crean tras un posible fork del servidor
+            if not self._threads:
+                self._threads = [
+                    threading.Thread(target=self._loop, name=f"provision-{i}", daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+            self._cond.notify()
+        return True
+
+    def forget(self, username: str) -> None:
+        """El siguiente login de ``username`` vuelve a prepararlo."""
+        self._done.pop(username)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                username = self._queue.popleft()
+            try:
+                self.provision(username)
+            except Exception:
+                self.failed += 1
+                logger.exception("No se pudo preparar al usuario %s", username)
+            else:
+                self.provisioned += 1
+                self._done.set(username, True)
+            finally:
+                with self._cond:
+                    self._pending.discard(username)
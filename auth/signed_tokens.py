@@ -0,0 +1,137 @@
+"""
+Tokens de JupyterLab firmados con HMAC, verificables sin consultar ningún almacén.
+
+Formato: ``v1.<kid>.<datos>.<firma>``, con ``datos`` en base64url
+(``{"u": usuario, "exp": caducidad, "jti": id}``) y ``firma`` el
+HMAC-SHA256 de ``v1.<kid>.<datos>`` con la clave ``kid`` del llavero.
+
+- Llavero: se firma con la primera clave y se aceptan todas. Para rotar, se
+  pone la clave nueva delante y la antigua se retira cuando caduquen sus
+  tokens (30 días).
+- Revocación: una lista pequeña de ``jti`` revocados (hasta su caducidad)
+  que se recarga cada ``refresh`` segundos con ``loader``; entre recargas la
+  verificación es solo cálculo en memoria.
+
+No depende de Flask: JupyterLab u otro servicio pueden verificar los tokens
+con este módulo y el mismo ``TOKEN_SIGNING_KEYS``.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import threading
+import time
+from typing import Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "v1"
+
+
+class TokenClaims(NamedTuple):
+    username: str
+    expires_at: float
+    jti: str
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def parse_keyring(spec: str) -> dict[str, bytes]:
+    """``"kid1:secreto1,kid2:secreto2"`` -> ``{kid: clave}`` (en orden; la primera firma)."""
+    keys: dict[str, bytes] = {}
+    for item in spec.split(","):
+        kid, sep, secret = item.strip().partition(":")
+        if not item.strip():
+            continue
+        if not sep or not kid or not secret or "." in kid:
+            raise ValueError(f"Clave de firma mal formada: {kid or item.strip()!r}")
+        keys[kid] = secret.encode("utf-8")
+    return keys
+
+
+def is_signed(token: object) -> bool:
+    return isinstance(token, str) and token.startswith(PREFIX + ".")
+
+
+class RevocationList:
+    """``jti`` revocados, recargados con ``loader`` como mucho cada ``refresh`` segundos."""
+
+    def __init__(self, loader: Callable[[], set[str]] | None = None, refresh: float = 30) -> None:
+        self.loader = loader
+        self.refresh = refresh
+        self._revoked: frozenset[str] = frozenset()
+        self._loaded_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _reload(self) -> None:
+        # Un solo hilo recarga; los demás siguen con la lista anterior
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._revoked = frozenset(self.loader())
+        except Exception as exc:
+            logger.warning("No se pudo recargar la lista de tokens revocados: %s", exc)
+        finally:
+            self._loaded_at = time.monotonic()
+            self._lock.release()
+
+    def add(self, jti: str) -> None:
+        # Con el mismo cerrojo que la recarga: una recarga en curso no la pisa
+        with self._lock:
+            self._revoked = self._revoked | {jti}
+
+    def __contains__(self, jti: str) -> bool:
+        if self.loader is not None and time.monotonic() - self._loaded_at >= self.refresh:
+            self._reload()
+        return jti in self._revoked
+
+
+class TokenSigner:
+    def __init__(self, keys: dict[str, bytes], revoked: RevocationList | None = None) -> None:
+        if not keys:
+            raise ValueError("El llavero de tokens está vacío")
+        self.keys = dict(keys)
+        self.active = next(iter(self.keys))
+        self.revoked = revoked if revoked is not None else RevocationList()
+
+    def _sign(self, kid: str, message: bytes) -> bytes:
+        return hmac.new(self.keys[kid], message, hashlib.sha256).digest()
+
+    def issue(self, username: str, lifetime_seconds: float) -> str:
+        payload = json.dumps(
+            {"u": username, "exp": int(time.time() + lifetime_seconds), "jti": secrets.token_urlsafe(12)},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        message = f"{PREFIX}.{self.active}.{_b64encode(payload)}"
+        return f"{message}.{_b64encode(self._sign(self.active, message.encode('ascii')))}"
+
+    def decode(self, token: str) -> TokenClaims | None:
+        """Datos del token si la firma es válida, sin mirar caducidad ni revocación."""
+        try:
+            message, _, signature = token.rpartition(".")
+            prefix, kid, payload = message.split(".")
+            if prefix != PREFIX or kid not in self.keys:
+                return None
+            if not hmac.compare_digest(self._sign(kid, message.encode("ascii")), _b64decode(signature)):
+                return None
+            data = json.loads(_b64decode(payload))
+            return TokenClaims(str(data["u"]), float(data["exp"]), str(data["jti"]))
+        except (ValueError, KeyError, TypeError, UnicodeError):
+            return None
+
+    def verify(self, token: str) -> str | None:
+        """Usuario del token si la firma es válida, no ha caducado y no está revocado."""
+        claims = self.decode(token)
+        if claims is None or time.time() >= claims.expires_at or claims.jti in self.revoked:
+            return None
+        return claims.username
@@ -0,0 +1,340 @@
+"""
+Almacén de tokens de JupyterLab en SQLite, con lecturas desde memoria.
+
+- Cada token es una fila de ``tokens`` (clave primaria), escrita en su propia
+  transacción: dos logins simultáneos ya no pisan el fichero del otro.
+- ``lookup`` responde desde un diccionario en memoria; si el token no está (lo
+  emitió otro proceso), lo busca por clave en SQLite y lo añade.
+- Un hilo borra periódicamente los tokens caducados.
+- ``revoked_tokens`` guarda, hasta que caducan, los tokens revocados: el
+  ``jti`` de los firmados (ver ``signed_tokens``) y un hash de los aleatorios.
+  Cada proceso relee la lista cada ``revocation_refresh`` segundos, así que un
+  token revocado en otro proceso deja de valer aunque siga en su memoria.
+- Al abrir la base de datos por primera vez se importan los tokens vigentes de
+  ``tokens.json`` (el formato anterior).
+- ``tokens.json`` se sigue generando, con el mismo formato, como exportación
+  para JupyterLab: se reescribe agrupando los cambios de unos segundos y en el
+  mismo inodo, porque docker-compose lo monta como fichero suelto en el
+  contenedor de JupyterLab (un ``rename`` dejaría allí la versión antigua).
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from signed_tokens import RevocationList
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "/app/users_data/tokens.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    token      TEXT PRIMARY KEY,
+    username   TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tokens_expires ON tokens (expires_at);
+CREATE INDEX IF NOT EXISTS idx_tokens_username ON tokens (username, expires_at);
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti        TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS token_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+class TokenStore:
+    """Tabla ``tokens`` en SQLite (WAL) con una conexión por proceso y caché en memoria."""
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        legacy_json: str | None = None,
+        export_paths: tuple[str, ...] = (),
+        export_delay: float = 2.0,
+        revocation_refresh: float = 30,
+    ) -> None:
+        self.db_path = db_path
+        self.legacy_json = legacy_json
+        self.export_paths = export_paths
+        self.export_delay = export_delay
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        # token -> (usuario, creación, caducidad); solo crece con tokens vigentes
+        self._cache: dict[str, tuple[str, float, float]] = {}
+        self._export_timer: threading.Timer | None = None
+        self._sweeper: threading.Thread | None = None
+        self.revoked = RevocationList(self.revoked_ids, refresh=revocation_refresh)
+
+    def _connection(self) -> sqlite3.Connection:
+        # Conexión perezosa: se abre tras un posible fork del servidor
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._migrate_legacy(conn)
+            now = time.time()
+            for row in conn.execute(
+                "SELECT token, username, created_at, expires_at FROM tokens WHERE expires_at > ?",
+                (now,),
+            ):
+                self._cache[row["token"]] = (row["username"], row["created_at"], row["expires_at"])
+            self._conn = conn
+        return self._conn
+
+    def _migrate_legacy(self, conn: sqlite3.Connection) -> None:
+        """Importa una sola vez los tokens vigentes del ``tokens.json`` anterior."""
+        if not self.legacy_json:
+            return
+        with conn:
+            # BEGIN IMMEDIATE: si arrancan varios procesos a la vez, solo uno importa
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM token_meta WHERE key = 'legacy_import'").fetchone():
+                return
+            try:
+                with open(self.legacy_json, "r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+            except FileNotFoundError:
+                legacy = {}
+            except (OSError, ValueError) as exc:
+                logger.error("No se pudo importar %s: %s", self.legacy_json, exc)
+                legacy = {}
+            rows = []
+            now = time.time()
+            for token, info in (legacy.items() if isinstance(legacy, dict) else ()):
+                try:
+                    expires = datetime.fromisoformat(info["expires"]).timestamp()
+                    created = datetime.fromisoformat(info.get("created", info["expires"])).timestamp()
+                    username = str(info["username"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if expires > now:
+                    rows.append((token, username, created, expires))
+            conn.executemany(
+                "INSERT OR IGNORE INTO tokens (token, username, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute(
+                "INSERT INTO token_meta (key, value) VALUES ('legacy_import', ?)",
+                (datetime.now().isoformat(),),
+            )
+        logger.info(
+            "Tokens importados de %s: %d vigentes de %d",
+            self.legacy_json, len(rows), len(legacy) if isinstance(legacy, dict) else 0,
+        )
+
+    def issue(
+        self,
+        username: str,
+        lifetime_seconds: float,
+        token: str | None = None,
+        expires_at: float | None = None,
+    ) -> str:
+        """Guarda un token para ``username`` (uno aleatorio si no se da ``token``)."""
+        token = token or secrets.token_urlsafe(32)
+        created = time.time()
+        expires = expires_at if expires_at is not None else created + lifetime_seconds
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT INTO tokens (token, username, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (token, username, created, expires),
+                )
+            self._cache[token] = (username, created, expires)
+        self._schedule_export()
+        return token
+
+    def lookup(self, token: str) -> str | None:
+        """Usuario del token si existe y no ha caducado."""
+        if not token:
+            return None
+        entry = self._cache.get(token)
+        if entry is None:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT username, created_at, expires_at FROM tokens WHERE token = ?",
+                    (token,),
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (row["username"], row["created_at"], row["expires_at"])
+                self._cache[token] = entry
+        username, _, expires = entry
+        if time.time() >= expires or _opaque_id(token) in self.revoked:
+            return None
+        return username
+
+    def latest_expiry(self, username: str) -> float | None:
+        """Caducidad del token más reciente de ``username`` (``None`` si no tiene)."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT MAX(expires_at) AS expires_at FROM tokens WHERE username = ?",
+                (username,),
+            ).fetchone()
+        return row["expires_at"] if row is not None else None
+
+    def revoke(self, token: str) -> bool:
+        """Borra un token y lo añade a la lista de revocados; devuelve si existía.
+
+        Los demás procesos lo rechazan en cuanto releen la lista, aunque lo
+        tengan en memoria (los tokens firmados se revocan además por ``jti``).
+        """
+        jti = _opaque_id(token)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                row = conn.execute("SELECT expires_at FROM tokens WHERE token = ?", (token,)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM tokens WHERE token = ?", (token,))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+                        (jti, row["expires_at"]),
+                    )
+            self._cache.pop(token, None)
+        if row is None:
+            return False
+        self.revoked.add(jti)
+        self._schedule_export()
+        return True
+
+    def revoke_id(self, jti: str, expires_at: float) -> None:
+        """Añade un token firmado a la lista de revocados hasta su caducidad."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+                    (jti, expires_at),
+                )
+        self.revoked.add(jti)
+
+    def revoked_ids(self) -> set[str]:
+        """``jti`` revocados que aún no han caducado."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT jti FROM revoked_tokens WHERE expires_at > ?", (time.time(),)
+            ).fetchall()
+        return {row["jti"] for row in rows}
+
+    def sweep(self) -> int:
+        """Borra los tokens caducados; devuelve cuántos había en la base de datos."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                removed = conn.execute("DELETE FROM tokens WHERE expires_at <= ?", (now,)).rowcount
+                conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,))
+            for token in [t for t, (_, _, expires) in self._cache.items() if expires <= now]:
+                del self._cache[token]
+        if removed:
+            logger.info("Tokens caducados eliminados: %d", removed)
+            self._schedule_export()
+        return removed
+
+    def start_sweeper(self, interval: float) -> None:
+        """Barrido al arrancar y luego cada ``interval`` segundos (idempotente)."""
+        with self._lock:
+            if self._sweeper is not None or interval <= 0:
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop, args=(interval,), name="token-sweeper", daemon=True
+            )
+        self._sweeper.start()
+
+    def _sweep_loop(self, interval: float) -> None:
+        while True:
+            try:
+                self.sweep()
+            except sqlite3.Error as exc:
+                logger.warning("Barrido de tokens: %s", exc)
+            time.sleep(interval)
+
+    def _schedule_export(self) -> None:
+        # Los cambios de los próximos ``export_delay`` segundos van en la misma escritura
+        if not self.export_paths:
+            return
+        with self._lock:
+            if self._export_timer is not None:
+                return
+            timer = threading.Timer(self.export_delay, self._run_export)
+            timer.daemon = True
+            self._export_timer = timer
+        timer.start()
+
+    def _run_export(self) -> None:
+        with self._lock:
+            self._export_timer = None
+        try:
+            self.export()
+        except (OSError, sqlite3.Error) as exc:
+            logger.error("Error exportando tokens: %s", exc)
+
+    def export(self) -> None:
+        """Escribe los tokens vigentes en ``export_paths`` con el formato de ``tokens.json``."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT token, username, created_at, expires_at FROM tokens "
+                "WHERE expires_at > ? ORDER BY created_at",
+                (time.time(),),
+            ).fetchall()
+        data = json.dumps(
+            {
+                row["token"]: {
+                    "username": row["username"],
+                    "created": _iso(row["created_at"]),
+                    "expires": _iso(row["expires_at"]),
+                }
+                for row in rows
+            },
+            indent=2,
+        ).encode("utf-8")
+        for index, path in enumerate(self.export_paths):
+            try:
+                _write_in_place(path, data)
+            except OSError as exc:
+                if index == 0:
+                    raise
+                logger.debug("No se exportaron los tokens a %s: %s", path, exc)
+
+
+def _opaque_id(token: str) -> str:
+    """Identificador de un token aleatorio en ``revoked_tokens`` (no se guarda el token)."""
+    return "sha256:" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _write_in_place(path: str, data: bytes) -> None:
+    """Reescribe ``path`` conservando el inodo (bind mounts), con flock entre procesos."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.ftruncate(fd, 0)
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -1,17 +1,38 @@
 # webapp/app.py
 from __future__ import annotations
 
+import base64
+import bisect
+import hmac
+import ipaddress
 import json
+import mimetypes
 import os
-import re
+import threading
+import time
+from html import escape
 from urllib.parse import quote
 
 import markdown
 import nbformat
-from flask import Flask, g, jsonify, render_template, request, send_file
+from flask import (
+    Flask, Response, g, jsonify, render_template, request, send_file, stream_with_context,
+)
 from markupsafe import Markup
 from nbconvert import HTMLExporter
+from asset_store import MIMETYPES, AssetStore
+from compression import choose_encoding
+from exporter_pool import ExporterPool
+from file_resolver import FileResolver
+from link_rewriter import DirectoryCache, LinkRewriter
+from metrics import CATALOG_NOTEBOOKS, cache_observer, exposition, observe_request, timed
+from notebook_catalog import NotebookCatalog, sort_key
 from notebook_parser import parse_notebook_header
+from notebook_store import DEFAULT_DB_PATH, NotebookStore
+from notebook_watcher import NotebookWatcher
+from prerender import PrerenderPipeline
+from profiling import ProfileSession, ProfileStore, StackSampler, folded
+from render_cache import RenderCache
 
 app = Flask(__name__)
 
@@ -25,6 +46,148 @@ _DEFAULT_JUPYTERLAB_PUBLIC_URL = (
     or "https://pe-ctic.test.ctic.es/"
 )
 
+# Catálogo de notebooks compartido por index() y api_notebooks(); lo mantiene al día
+# un hilo inotify con reconciliación periódica (segundos configurables) y se
+# persiste en SQLite para compartirlo entre workers y reinicios (vacío = solo memoria).
+_CATALOG_DB = os.getenv("WEBAPP_CATALOG_DB", DEFAULT_DB_PATH).strip()
+_CATALOG = NotebookCatalog(store=NotebookStore(_CATALOG_DB) if _CATALOG_DB else None)
+_CATALOG_WATCHER = NotebookWatcher(
+    _CATALOG,
+    reconcile_seconds=float(os.getenv("WEBAPP_CATALOG_RECONCILE_SECONDS", "300")),
+)
+_CATALOG.add_listener(lambda changed, deletes: CATALOG_NOTEBOOKS.set(len(_CATALOG)))
+
+# Caché de las páginas de notebook renderizadas: LRU en memoria + almacén en disco
+# acotados por bytes (directorio vacío = solo memoria). Con WEBAPP_PRECOMPRESS, cada
+# entrada guarda también sus variantes gzip/brotli, comprimidas una sola vez.
+_PRECOMPRESS = os.getenv("WEBAPP_PRECOMPRESS", "1").strip() == "1"
+_RENDER_CACHE_DIR = os.getenv("WEBAPP_RENDER_CACHE_DIR", "/app/cache/render").strip()
+_RENDER_CACHE = RenderCache(
+    _RENDER_CACHE_DIR or None,
+    memory_bytes=int(os.getenv("WEBAPP_RENDER_CACHE_MEMORY_MB", "256")) * 1024 * 1024,
+    disk_bytes=int(os.getenv("WEBAPP_RENDER_CACHE_DISK_MB", "2048")) * 1024 * 1024,
+    compress=_PRECOMPRESS,
+    observer=cache_observer("render"),
+)
+# Respuestas JSON de /api/notebooks por versión del catálogo y parámetros
+_API_CACHE = RenderCache(
+    None,
+    memory_bytes=int(os.getenv("WEBAPP_API_CACHE_MEMORY_MB", "32")) * 1024 * 1024,
+    compress=_PRECOMPRESS,
+    observer=cache_observer("api"),
+)
+
+# Listados de directorio para resolver las rutas de imágenes (segundos de validez)
+_DIRECTORY_CACHE = DirectoryCache(ttl=float(os.getenv("WEBAPP_LINK_CACHE_TTL", "30")))
+
+# /files: resoluciones de ruta cacheadas y, detrás de nginx, entrega de los bytes
+# delegada en su location interna (prefijo de X-Accel-Redirect; vacío = Flask)
+_FILE_RESOLVER = FileResolver(ttl=float(os.getenv("WEBAPP_FILES_CACHE_TTL", "10")))
+_FILES_ACCEL_PREFIX = os.getenv("WEBAPP_FILES_ACCEL_PREFIX", "").strip().rstrip("/")
+
+# Modo opcional: extraer las imágenes base64 del HTML a un almacén por contenido
+# servido en /assets con caché inmutable (vacío = imágenes incrustadas)
+_ASSET_DIR = os.getenv("WEBAPP_ASSET_DIR", "/app/cache/assets").strip()
+# El almacén se acota a WEBAPP_ASSET_DISK_MB entre todos los workers (0 = sin límite)
+_ASSET_STORE = (
+    AssetStore(_ASSET_DIR, max_bytes=int(os.getenv("WEBAPP_ASSET_DISK_MB", "1024")) * 1024 * 1024)
+    if _ASSET_DIR and os.getenv("WEBAPP_EXTRACT_IMAGES", "0").strip() == "1"
+    else None
+)
+_ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+# Notebooks a partir de este tamaño se envían en streaming, celda a celda,
+# sin pasar por la caché de renders (0 = desactivado)
+_STREAM_MIN_BYTES = int(float(os.getenv("WEBAPP_STREAM_MIN_MB", "0")) * 1024 * 1024)
+_STREAM_MARKER = "PE-CTIC-STREAM-SLOT"
+
+
+def _render_key(full_path, stat_info, webapp_prefix):
+    """Clave de la caché de renders: la página depende del fichero, del prefijo
+    público (rutas /files) y de si las imágenes se extraen a /assets.
+
+    None para los notebooks que se sirven en streaming (no se cachean).
+    """
+    if _STREAM_MIN_BYTES and stat_info.st_size >= _STREAM_MIN_BYTES:
+        return None
+    return (
+        'page', full_path, stat_info.st_mtime, stat_info.st_size, webapp_prefix,
+        _ASSET_STORE is not None,
+    )
+
+# Pre-renderizado en segundo plano de los notebooks nuevos o modificados
+# (lo ejecuta solo el worker que actualiza el catálogo), con ambos prefijos públicos
+_PRERENDER: PrerenderPipeline | None = None
+if os.getenv("WEBAPP_PRERENDER", "1").strip() == "1":
+    _PRERENDER = PrerenderPipeline(
+        _CATALOG,
+        _RENDER_CACHE,
+        lambda path, prefix: render_notebook_page(path, prefix),
+        render_key=_render_key,
+        prefixes=sorted({_DEFAULT_WEBAPP_PREFIX, ""}, reverse=True),
+        workers=int(os.getenv("WEBAPP_PRERENDER_WORKERS", "1")),
+        status_path=(
+            os.path.join(_RENDER_CACHE_DIR, "prerender-status.json")
+            if _RENDER_CACHE_DIR else None
+        ),
+    )
+
+# Perfilado: cProfile bajo demanda (?profile=1 o cabecera X-Webapp-Profile: 1) para
+# las IPs de WEBAPP_PROFILE_ALLOW (vacío = desactivado) y, si se define, con el token
+# de WEBAPP_PROFILE_TOKEN; y muestreo automático de las peticiones más lentas que
+# WEBAPP_SLOW_REQUEST_SECONDS (0 = desactivado). Los artefactos van a WEBAPP_PROFILE_DIR.
+_PROFILE_ALLOW = [
+    ipaddress.ip_network(value.strip(), strict=False)
+    for value in os.getenv("WEBAPP_PROFILE_ALLOW", "").split(",")
+    if value.strip()
+]
+_PROFILE_TOKEN = os.getenv("WEBAPP_PROFILE_TOKEN", "").strip()
+_PROFILE_STORE = ProfileStore(
+    os.getenv("WEBAPP_PROFILE_DIR", "/app/cache/profiles").strip(),
+    keep=int(os.getenv("WEBAPP_PROFILE_KEEP", "50")),
+)
+_PROFILED_ENDPOINTS = {'view_notebook', 'api_notebooks'}
+_SLOW_REQUEST_SECONDS = float(os.getenv("WEBAPP_SLOW_REQUEST_SECONDS", "5"))
+_SAMPLER = (
+    StackSampler(interval=float(os.getenv("WEBAPP_SLOW_SAMPLE_MS", "20")) / 1000)
+    if _SLOW_REQUEST_SECONDS > 0 else None
+)
+
+# El logo se monta en solo lectura: basta comprobarlo una vez
+_LOGO_PATH = "/app/static/logo.png"
+_LOGO_EXISTS: bool | None = None
+
+
+def _logo_exists() -> bool:
+    global _LOGO_EXISTS
+    if _LOGO_EXISTS is None:
+        _LOGO_EXISTS = os.path.exists(_LOGO_PATH) and os.path.getsize(_LOGO_PATH) > 0
+    return _LOGO_EXISTS
+
+
+@app.before_request
+def _start_request_timer() -> None:
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    """Latencia por regla de ruta (no por URL, para acotar las series)."""
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "<sin ruta>"
+        observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+@app.before_request
+def _start_catalog_watcher() -> None:
+    """Arranca el vigilante en el primer request (tras un posible fork del servidor)."""
+    _CATALOG_WATCHER.start()
+    if _PRERENDER is not None:
+        _PRERENDER.start()
+
 
 @app.before_request
 def _set_webapp_public_prefix() -> None:
@@ -35,10 +198,113 @@ def _set_webapp_public_prefix() -> None:
         g.webapp_prefix = _DEFAULT_WEBAPP_PREFIX
 
 
+def _profiling_allowed() -> bool:
+    """IP del cliente (la que pasa nginx) en la lista permitida y, si lo hay, token correcto."""
+    if not _PROFILE_ALLOW:
+        return False
+    try:
+        client = ipaddress.ip_address(
+            (request.headers.get("X-Real-IP") or request.remote_addr or "").strip()
+        )
+    except ValueError:
+        return False
+    if not any(client in network for network in _PROFILE_ALLOW):
+        return False
+    if _PROFILE_TOKEN:
+        token = request.headers.get("X-Webapp-Profile-Token", "")
+        return hmac.compare_digest(token.encode("utf-8"), _PROFILE_TOKEN.encode("utf-8"))
+    return True
+
+
+def _profile_meta(response, duration: float) -> dict:
+    meta = {
+        "route": request.url_rule.rule if request.url_rule is not None else None,
+        "path": request.path,
+        "query": request.query_string.decode("utf-8", "replace"),
+        "method": request.method,
+        "status": response.status_code,
+        "duration_seconds": round(duration, 4),
+        "pid": os.getpid(),
+    }
+    notebook_path = (request.view_args or {}).get("notebook_path")
+    if notebook_path:
+        meta["notebook"] = notebook_path
+    return meta
+
+
+def _save_profile(kind: str, meta: dict, files: dict[str, bytes]) -> str | None:
+    if "notebook" in meta:
+        try:
+            meta["notebook_bytes"] = os.path.getsize(os.path.join('/app/shared', meta["notebook"]))
+        except OSError:
+            pass
+    try:
+        return _PROFILE_STORE.save(kind, meta, files)
+    except OSError as exc:
+        app.logger.warning("No se pudo guardar el perfil (%s): %s", kind, exc)
+        return None
+
+
+@app.before_request
+def _start_profiling() -> None:
+    """cProfile si lo pide un administrador; si no, muestreo por si la petición es lenta."""
+    requested = (
+        request.args.get("profile") == "1" or request.headers.get("X-Webapp-Profile") == "1"
+    )
+    if requested and request.endpoint in _PROFILED_ENDPOINTS and _profiling_allowed():
+        g.profile = ProfileSession.start()
+        g.profile_busy = g.profile is None
+        return
+    if _SAMPLER is not None:
+        g.sampling = threading.get_ident()
+        _SAMPLER.begin(g.sampling)
+
+
+@app.after_request
+def _finish_profiling(response):
+    session = g.pop("profile", None)
+    if session is not None:
+        duration, files = session.stop()
+        artifact = _save_profile("profile", _profile_meta(response, duration), files)
+        if artifact is not None:
+            response.headers["X-Webapp-Profile"] = artifact
+    elif g.get("profile_busy"):
+        # Otro perfil en curso en este proceso: la petición se sirve sin perfilar
+        response.headers["X-Webapp-Profile"] = "busy"
+
+    ident = g.pop("sampling", None)
+    if ident is not None:
+        # Al cerrar la respuesta (incluye las páginas en streaming)
+        started = g.request_started
+        meta = _profile_meta(response, 0.0)
+
+        def finish_sampling():
+            samples = _SAMPLER.end(ident)
+            duration = time.perf_counter() - started
+            if duration < _SLOW_REQUEST_SECONDS or not samples:
+                return
+            meta["duration_seconds"] = round(duration, 4)
+            meta["samples"] = sum(samples.values())
+            _save_profile("slow", meta, {"folded": folded(samples)})
+
+        response.call_on_close(finish_sampling)
+    return response
+
+
+@app.teardown_request
+def _abort_profiling(exc) -> None:
+    """Si la vista lanzó una excepción, after_request no se ejecuta: se liberan aquí."""
+    session = g.pop("profile", None)
+    if session is not None:
+        session.stop()
+    ident = g.pop("sampling", None)
+    if ident is not None:
+        _SAMPLER.end(ident)
+
+
 @app.context_processor
 def inject_logo_exists():
-    logo_path = "/app/static/logo.png"
-    logo_exists = os.path.exists(logo_path) and os.path.getsize(logo_path) > 0
+    logo_exists = _logo_exists()
     wp = getattr(g, "webapp_prefix", _DEFAULT_WEBAPP_PREFIX)
     return dict(
         logo_exists=logo_exists,
@@ -53,14 +319,23 @@ def pe_path_url(path: str) -> str:
     return quote(path, safe="/")
 
 
-def _files_url_base() -> str:
-    """Base para /files/... según prefijo público (vacío = /files)."""
-    if not hasattr(g, "webapp_prefix"):
+def _files_url_base(webapp_prefix: str | None = None) -> str:
+    """Base para /files/... según prefijo público (vacío = /files).
+
+    Sin ``webapp_prefix`` explícito se usa el de la petición en curso.
+    """
+    if webapp_prefix is not None:
+        p = webapp_prefix
+    elif not hasattr(g, "webapp_prefix"):
         p = _DEFAULT_WEBAPP_PREFIX
     else:
         p = g.webapp_prefix
     return f"{p}/files" if p else "/files"
 
+def _assets_url_base(webapp_prefix: str | None = None) -> str:
+    """Base para /assets/... (mismas reglas de prefijo que ``_files_url_base``)."""
+    return _files_url_base(webapp_prefix)[: -len("/files")] + "/assets"
+
 # Configurar ruta para archivos estáticos (logo)
 @app.route('/static/<path:filename>')
 def static_files(filename):
@@ -69,25 +344,90 @@ def static_files(filename):
 # Endpoint para servir archivos desde shared y users
 @app.route('/files/<path:file_path>')
 def serve_file(file_path):
-    """Servir archivos desde shared/ o users/"""
-    # Asegurar que el path es relativo
-    if file_path.startswith('/'):
-        file_path = file_path[1:]
-    
-    # Intentar primero en shared
-    shared_path = os.path.join('/app/shared', file_path)
-    if os.path.exists(shared_path) and os.path.isfile(shared_path):
-        return send_file(shared_path)
+    """Servir archivos desde shared/ o users/
+
+    La ruta se resuelve (y se confina a shared/users) con caché. Con
+    ``WEBAPP_FILES_ACCEL_PREFIX`` los bytes los envía nginx vía X-Accel-Redirect,
+    con ETag, Last-Modified y rangos; si no, ``send_file`` responde igualmente
+    a peticiones condicionales (304) y de rangos (206).
+    """
+    resolved = _FILE_RESOLVER.resolve(file_path)
+    if resolved is None:
+        return "Archivo no encontrado", 404
+    root_name, rel_path, full_path = resolved
     
-    # Si no está en shared, buscar en users
-    users_path = os.path.join('/app/users', file_path)
-    if os.path.exists(users_path) and os.path.isfile(users_path):
-        return send_file(users_path)
+    if _FILES_ACCEL_PREFIX:
+        mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{_FILES_ACCEL_PREFIX}/{root_name}/{quote(rel_path)}"
+        return response
     
-    return "Archivo no encontrado", 404
+    try:
+        return send_file(full_path, conditional=True, etag=True)
+    except FileNotFoundError:
+        # Borrado después de cachear la resolución
+        _FILE_RESOLVER.forget(file_path)
+        return "Archivo no encontrado", 404
+
+# Imágenes extraídas de los notebooks: el nombre es el hash del contenido
+@app.route('/assets/<name>')
+def serve_asset(name):
+    """Servir una imagen del almacén de assets con caché inmutable"""
+    path = _ASSET_STORE.path_for(name) if _ASSET_STORE is not None else None
+    if path is None or not os.path.isfile(path):
+        return "Archivo no encontrado", 404
+    _ASSET_STORE.touch(path)
+    response = send_file(path, mimetype=MIMETYPES[name.rsplit('.', 1)[1]], etag=name.split('.')[0])
+    response.headers['Cache-Control'] = f'public, max-age={_ASSET_MAX_AGE}, immutable'
+    return response
+
+def _markdown2html(source):
+    return markdown.markdown(
+        source, 
+        extensions=['fenced_code', 'tables', 'codehilite', 'nl2br']
+    )
 
-def convert_notebook_to_html(notebook_path):
-    """Convierte notebook a HTML para visualización usando nbconvert"""
+def _new_html_exporter():
+    """HTMLExporter con la configuración de la webapp."""
+    html_exporter = HTMLExporter()
+    html_exporter.template_name = 'classic'
+    # Configurar para no escapar caracteres LaTeX incorrectamente
+    html_exporter.filters = {'markdown2html': _markdown2html}
+    return html_exporter
+
+# Plantilla que genera solo las celdas (streaming de notebooks grandes)
+_NBCONVERT_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nbconvert_templates')
+_CELLS_WRAPPER_OPEN = '<div class="jp-Notebook">'
+_CELLS_WRAPPER_CLOSE = '</div>'
+
+def _new_cells_exporter():
+    """Exportador de celdas sueltas, con los mismos filtros que ``_new_html_exporter``."""
+    html_exporter = HTMLExporter(
+        extra_template_basedirs=[_NBCONVERT_TEMPLATES], template_name='pe_ctic_cells'
+    )
+    html_exporter.filters = {'markdown2html': _markdown2html}
+    return html_exporter
+
+# Exportadores reutilizados entre peticiones; se crean y precalientan al arrancar
+# con un notebook mínimo para que el primer render no pague la carga de plantillas
+_EXPORTER_POOL_SIZE = int(os.getenv("WEBAPP_EXPORTER_POOL_SIZE", "4"))
+_EXPORTER_POOL = ExporterPool(_new_html_exporter, size=_EXPORTER_POOL_SIZE)
+_CELLS_EXPORTER_POOL = ExporterPool(_new_cells_exporter, size=_EXPORTER_POOL_SIZE)
+if os.getenv("WEBAPP_EXPORTER_WARMUP", "1").strip() == "1":
+    _warmup_notebook = nbformat.v4.new_notebook(cells=[
+        nbformat.v4.new_markdown_cell("# PE-CTIC"),
+        nbformat.v4.new_code_cell("print('ok')"),
+    ])
+    _EXPORTER_POOL.warm(_warmup_notebook)
+    if _STREAM_MIN_BYTES:
+        _CELLS_EXPORTER_POOL.warm(_warmup_notebook)
+
+def convert_notebook_to_html(notebook_path, webapp_prefix=None):
+    """Convierte notebook a HTML para visualización usando nbconvert
+
+    ``webapp_prefix`` fija el prefijo de las URLs /files (por defecto, el de la
+    petición); permite renderizar fuera de una petición (pre-renderizado).
+    """
     try:
         # Leer el notebook
         with open(notebook_path, 'r', encoding='utf-8') as f:
@@ -97,20 +437,12 @@ def convert_notebook_to_html(notebook_path):
         notebook_dir = os.path.dirname(notebook_path)
         
         # Convertir a HTML usando nbconvert (nbconvert maneja las imágenes base64 automáticamente)
-        html_exporter = HTMLExporter()
-        html_exporter.template_name = 'classic'
-        # Configurar para no escapar caracteres LaTeX incorrectamente
-        html_exporter.filters = {
-            'markdown2html': lambda source: markdown.markdown(
-                source, 
-                extensions=['fenced_code', 'tables', 'codehilite', 'nl2br']
-            )
-        }
-        (body, resources) = html_exporter.from_notebook_node(nb)
+        with timed("render"), _EXPORTER_POOL.exporter() as html_exporter:
+            (body, resources) = html_exporter.from_notebook_node(nb)
         
         # Solo procesar rutas relativas de imágenes estáticas en markdown
         # NO tocar las imágenes base64 generadas por Python (nbconvert las maneja correctamente)
-        body = fix_image_paths(body, notebook_dir)
+        body = _postprocess_html(body, notebook_dir, webapp_prefix)
         
         return body
     except Exception as e:
@@ -131,215 +463,91 @@ def convert_notebook_to_html(notebook_path):
                 html_content += f"<div class='output-cell'><pre>{cell.outputs[0]['text']}</pre></div>"
         
         # Procesar el HTML para convertir rutas relativas de imágenes
-        html_content = fix_image_paths(html_content, notebook_dir)
+        with timed("rewrite"):
+            html_content = fix_image_paths(html_content, notebook_dir, webapp_prefix)
         
         return html_content
 
-def fix_image_paths(html_content, notebook_dir):
-    """Convierte rutas relativas de imágenes estáticas a rutas absolutas para la webapp
-    NO modifica imágenes base64 generadas por Python (nbconvert las maneja automáticamente)
+def _postprocess_html(html_content, notebook_dir, webapp_prefix=None):
+    """Rutas de imágenes y, en modo extracción, imágenes base64 al almacén de assets"""
+    with timed("rewrite"):
+        html_content = fix_image_paths(html_content, notebook_dir, webapp_prefix)
+        if _ASSET_STORE is not None:
+            html_content = _ASSET_STORE.extract_images(html_content, _assets_url_base(webapp_prefix))
+    return html_content
+
+def stream_notebook_html(notebook_path, webapp_prefix=None):
+    """Genera el HTML de nbconvert por trozos: cabecera, cada celda y cierre
+
+    La cabecera (CSS, scripts) sale de renderizar el notebook sin celdas; cada
+    celda se renderiza y se post-procesa por separado, así que la memoria no
+    crece con el HTML de todo el notebook.
     """
-    files_base = _files_url_base()
-    legacy_files = "/pe-ctic/webapp/files"
-
-    # Determinar si el notebook está en shared o users
-    is_shared = "/app/shared" in notebook_dir
-    is_users = "/app/users" in notebook_dir
-
-    # Obtener el directorio base y la ruta relativa
-    if is_shared:
-        base_path = "/app/shared"
-        rel_dir = os.path.relpath(notebook_dir, "/app/shared")
-    elif is_users:
-        base_path = "/app/users"
-        rel_dir = os.path.relpath(notebook_dir, "/app/users")
-    else:
-        base_path = None
-        rel_dir = ""
-
-    def replace_image_path(match):
-        img_path = match.group(1)
-
-        # NO tocar imágenes base64 (nbconvert las maneja automáticamente)
-        if img_path.startswith("data:image"):
-            return match.group(0)
-
-        # Si ya es una URL HTTP/HTTPS, no hacer nada
-        if img_path.startswith("http://") or img_path.startswith("https://"):
-            return match.group(0)
-
-        # Si ya es una ruta web de la aplicación (prefijo actual o legado)
-        if img_path.startswith(files_base + "/") or img_path == files_base:
-            return match.group(0)
-        if img_path.startswith(legacy_files + "/") or img_path.startswith("/files/"):
-            return match.group(0)
-
-        # Si es una ruta absoluta del sistema de archivos
-        if img_path.startswith("/"):
-            # Convertir rutas absolutas del sistema de archivos a rutas web
-            if (
-                "/home/jovyan/shared/" in img_path
-                or "/home/shared/" in img_path
-                or img_path.startswith("/home/jovyan/shared/")
-                or img_path.startswith("/home/shared/")
-            ):
-                rel_path = (
-                    img_path.replace("/home/jovyan/shared/", "")
-                    .replace("/home/shared/", "")
-                    .lstrip("/")
-                )
-                return f"src=\"{files_base}/{rel_path}\""
-            if (
-                "/home/jovyan/users/" in img_path
-                or "/home/users/" in img_path
-                or img_path.startswith("/home/jovyan/users/")
-                or img_path.startswith("/home/users/")
-            ):
-                rel_path = (
-                    img_path.replace("/home/jovyan/users/", "")
-                    .replace("/home/users/", "")
-                    .lstrip("/")
-                )
-                return f"src=\"{files_base}/{rel_path}\""
-            # Si no es de shared/users, dejar como está
-            return match.group(0)
-
-        # Es una ruta relativa, resolverla
-        if base_path and rel_dir:
-            # Resolver la ruta relativa desde el directorio del notebook
-            resolved_path = os.path.normpath(os.path.join(base_path, rel_dir, img_path))
-
-            # Verificar que la ruta resuelta esté dentro de shared o users
-            if resolved_path.startswith("/app/shared/"):
-                rel_path = resolved_path.replace("/app/shared/", "")
-                # Verificar que el archivo existe
-                if os.path.exists(resolved_path):
-                    return f"src=\"{files_base}/{rel_path}\""
-            elif resolved_path.startswith("/app/users/"):
-                rel_path = resolved_path.replace("/app/users/", "")
-                # Verificar que el archivo existe
-                if os.path.exists(resolved_path):
-                    return f"src=\"{files_base}/{rel_path}\""
-            # Si la ruta resuelta sale de shared/users, intentar buscar en ambos
-            else:
-                # Intentar buscar en shared
-                shared_path = os.path.normpath(os.path.join("/app/shared", img_path.lstrip("/")))
-                if os.path.exists(shared_path):
-                    rel_path = shared_path.replace("/app/shared/", "")
-                    return f"src=\"{files_base}/{rel_path}\""
-                # Intentar buscar en users
-                users_path = os.path.normpath(os.path.join("/app/users", img_path.lstrip("/")))
-                if os.path.exists(users_path):
-                    rel_path = users_path.replace("/app/users/", "")
-                    return f"src=\"{files_base}/{rel_path}\""
-
-        # Si no se puede resolver, intentar directamente (puede que el usuario haya puesto la ruta correcta)
-        # Limpiar la ruta de ../ y ./
-        clean_path = os.path.normpath(img_path).replace("\\", "/").lstrip("/")
-        return f"src=\"{files_base}/{clean_path}\""
+    with open(notebook_path, 'r', encoding='utf-8') as f:
+        nb = nbformat.read(f, as_version=4)
+    notebook_dir = os.path.dirname(notebook_path)
     
-    # Reemplazar rutas en atributos src de imágenes
-    html_content = re.sub(r'src="([^"]+)"', replace_image_path, html_content)
+    with timed("render"), _EXPORTER_POOL.exporter() as html_exporter:
+        shell, _ = html_exporter.from_notebook_node(nbformat.v4.new_notebook(
+            cells=[nbformat.v4.new_raw_cell(_STREAM_MARKER)], metadata=nb.metadata
+        ))
+    head, tail = shell.split(_STREAM_MARKER, 1)
+    yield head
     
-    # También reemplazar en atributos srcset si existen
-    html_content = re.sub(r'srcset="([^"]+)"', replace_image_path, html_content)
+    # Las celdas ya enviadas se sueltan para que el notebook se libere poco a poco
+    cells = nb.cells[::-1]
+    nb.cells = []
+    while cells:
+        cell = cells.pop()
+        try:
+            with timed("render"), _CELLS_EXPORTER_POOL.exporter() as cells_exporter:
+                html, _ = cells_exporter.from_notebook_node(
+                    nbformat.v4.new_notebook(cells=[cell], metadata=nb.metadata)
+                )
+            html = html.strip()
+            if html.startswith(_CELLS_WRAPPER_OPEN) and html.endswith(_CELLS_WRAPPER_CLOSE):
+                html = html[len(_CELLS_WRAPPER_OPEN):-len(_CELLS_WRAPPER_CLOSE)]
+        except Exception:
+            # Misma conversión simple que el fallback de convert_notebook_to_html
+            app.logger.exception("Error renderizando una celda de %s", notebook_path)
+            if cell.cell_type == 'markdown':
+                html = f"<div class='markdown-cell'>{markdown.markdown(cell.source, extensions=['fenced_code', 'tables', 'codehilite'])}</div>"
+            else:
+                html = f"<div class='code-cell'><pre><code>{escape(cell.source)}</code></pre></div>"
+        yield _postprocess_html(html, notebook_dir, webapp_prefix)
     
-    return html_content
+    yield tail
+
+def fix_image_paths(html_content, notebook_dir, webapp_prefix=None):
+    """Convierte rutas relativas de imágenes estáticas a rutas absolutas para la webapp
+    NO modifica imágenes base64 generadas por Python (nbconvert las maneja automáticamente)
+
+    Una sola pasada para ``src`` y ``srcset`` (ver ``link_rewriter``); la
+    existencia de los ficheros se consulta en la caché de directorios.
+    """
+    rewriter = LinkRewriter(notebook_dir, _files_url_base(webapp_prefix), _DIRECTORY_CACHE)
+    return rewriter.rewrite(html_content)
 
 @app.route('/')
 def index():
     """Página principal con listado de notebooks"""
-    notebooks = []
-    
-    # Escanear notebooks en shared
-    shared_notebooks_dir = '/app/shared/notebooks'
-    if os.path.exists(shared_notebooks_dir):
-        for root, dirs, files in os.walk(shared_notebooks_dir):
-            # Excluir directorios de checkpoints
-            if '.ipynb_checkpoints' in root:
-                continue
-                
-            for file in files:
-                # Excluir checkpoints y archivos ocultos
-                if file.endswith('.ipynb') and not file.startswith('.') and 'checkpoint' not in file:
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, '/app/shared')
-                    
-                    # Obtener información del archivo
-                    stat_info = os.stat(full_path)
-                    modified_time = stat_info.st_mtime
-                    
-                    # Obtener usuario propietario desde metadata del notebook
-                    owner_name = "Desconocido"
-                    
-                    # Intentar leer metadata del notebook
-                    try:
-                        with open(full_path, 'r', encoding='utf-8') as f:
-                            nb_data = json.load(f)
-                            if 'metadata' in nb_data and 'pe_ctic' in nb_data['metadata']:
-                                owner_name = nb_data['metadata']['pe_ctic'].get('created_by', 
-                                    nb_data['metadata']['pe_ctic'].get('last_modified_by', 'Desconocido'))
-                    except:
-                        pass
-                    
-                    # Si no hay metadata, usar UID como fallback
-                    if owner_name == "Desconocido":
-                        owner_uid = stat_info.st_uid
-                        uid_map = {
-                            1000: 'jovyan',
-                            0: 'root',
-                            1005: 'agarnung'
-                        }
-                        owner_name = uid_map.get(owner_uid, f"Usuario {owner_uid}")
-                    
-                    # Extraer metadata de la cabecera del notebook
-                    header_metadata = parse_notebook_header(full_path)
-                    
-                    # Formatear fecha
-                    from datetime import datetime
-                    modified_date = datetime.fromtimestamp(modified_time)
-                    
-                    notebooks.append({
-                        'title': header_metadata.get('titulo', file.replace('.ipynb', '')),
-                        'filename': file.replace('.ipynb', ''),
-                        'path': rel_path,
-                        'full_path': full_path,
-                        'type': 'shared',
-                        'modified': modified_time,
-                        'modified_date': modified_date,
-                        'owner': owner_name,
-                        'autor': header_metadata.get('autor', '-'),
-                        'fecha': header_metadata.get('fecha', '-'),
-                        'tema': header_metadata.get('tema', '-'),
-                        'topico': header_metadata.get('topico', '-'),
-                        'keywords': header_metadata.get('keywords', '-'),
-                        'descripcion': header_metadata.get('descripcion', '-')
-                    })
-    
-    # Ordenar por fecha de modificación (más recientes primero)
-    notebooks.sort(key=lambda x: x['modified'], reverse=True)
+    # Catálogo en memoria mantenido por el vigilante: sin acceso a disco aquí.
+    # Las tarjetas las pide la página a /api/notebooks por páginas.
+    total = len(_CATALOG)
     
-    # Extraer valores únicos para los filtros
-    autores = sorted(set([nb['autor'] for nb in notebooks if nb['autor'] != '-']))
-    temas = sorted(set([nb['tema'] for nb in notebooks if nb['tema'] != '-']))
-    keywords_all = []
-    for nb in notebooks:
-        if nb['keywords'] != '-':
-            # Separar keywords por comas
-            kw_list = [k.strip() for k in nb['keywords'].split(',')]
-            keywords_all.extend(kw_list)
-    keywords = sorted(set([k for k in keywords_all if k]))
+    # Valores de los filtros con su número de notebooks (índice de facetas precalculado)
+    facets = _CATALOG.facets()
     
     # Verificar si existe el logo y no está vacío
-    logo_path = '/app/static/logo.png'
-    logo_exists = os.path.exists(logo_path) and os.path.getsize(logo_path) > 0
+    logo_exists = _logo_exists()
     
     return render_template('index.html', 
-                          notebooks=notebooks, 
+                          total=total, 
+                          page_size=_INDEX_PAGE_SIZE,
                           logo_exists=logo_exists,
-                          autores=autores,
-                          temas=temas,
-                          keywords=keywords)
+                          autores=facets['autor'],
+                          temas=facets['tema'],
+                          keywords=facets['keyword'])
 
 @app.route('/notebook/<path:notebook_path>')
 def view_notebook(notebook_path):
@@ -351,105 +559,238 @@ def view_notebook(notebook_path):
     full_path = os.path.join('/app/shared', notebook_path)
     
     if os.path.exists(full_path) and full_path.endswith('.ipynb'):
-        html_content = convert_notebook_to_html(full_path)
-        notebook_name = os.path.basename(notebook_path).replace('.ipynb', '')
-        logo_path = '/app/static/logo.png'
-        logo_exists = os.path.exists(logo_path) and os.path.getsize(logo_path) > 0
+        stat_info = os.stat(full_path)
+        render_key = _render_key(full_path, stat_info, g.webapp_prefix)
+        if _PRERENDER is not None:
+            _PRERENDER.note_view(full_path)
         
-        # Extraer metadata del notebook
-        metadata = parse_notebook_header(full_path)
+        if g.get('profile') is not None:
+            # Perfil bajo demanda: render completo, sin caché ni streaming
+            return Response(render_notebook_page(full_path, g.webapp_prefix), mimetype='text/html')
         
-        return render_template('notebook.html', 
-                             content=Markup(html_content), 
-                             notebook_name=notebook_name, 
-                             logo_exists=logo_exists,
-                             metadata=metadata)
+        if render_key is None:
+            return _stream_notebook_page(full_path, **_notebook_page_context(full_path))
+        
+        # Página completa cacheada, con sus variantes comprimidas
+        webapp_prefix = g.webapp_prefix
+        entry = _RENDER_CACHE.get_entry(
+            render_key, lambda: render_notebook_page(full_path, webapp_prefix),
+            # Si se ha expulsado alguna imagen de la página, se vuelve a renderizar
+            validate=_ASSET_STORE.present if _ASSET_STORE is not None else None,
+        )
+        return _encoded_response(entry, 'text/html')
     return "Notebook no encontrado", 404
 
+def _notebook_page_context(full_path):
+    """Variables de notebook.html salvo el contenido"""
+    notebook_name = os.path.basename(full_path).replace('.ipynb', '')
+    
+    # Extraer metadata del notebook (ya parseada en el catálogo si es compartido)
+    record = _CATALOG.get(full_path)
+    if record is not None:
+        metadata = {k: record[k] for k in ('autor', 'fecha', 'tema', 'topico', 'keywords', 'descripcion')}
+        metadata['titulo'] = record['title']
+    else:
+        with timed("parse"):
+            metadata = parse_notebook_header(full_path)
+    
+    return dict(notebook_name=notebook_name, logo_exists=_logo_exists(), metadata=metadata)
+
+def render_notebook_page(full_path, webapp_prefix):
+    """Página completa de un notebook (notebook.html con el HTML de nbconvert)
+
+    Usa su propio contexto de aplicación, así que también sirve fuera de una
+    petición (pre-renderizado).
+    """
+    with app.app_context():
+        g.webapp_prefix = webapp_prefix
+        return render_template('notebook.html',
+                               content=Markup(convert_notebook_to_html(full_path, webapp_prefix)),
+                               **_notebook_page_context(full_path))
+
+def _encoded_response(entry, mimetype):
+    """Respuesta con la variante de ``entry`` que acepta el cliente (sin comprimir en el peor caso)"""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), entry.variants)
+    response = Response(entry.variants[encoding] if encoding else entry.data, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if _PRECOMPRESS:
+        response.vary.add('Accept-Encoding')
+    return response
+
+def _stream_notebook_page(full_path, notebook_name, logo_exists, metadata):
+    """Página de notebook en streaming: plantilla, celdas a medida que se renderizan y cierre"""
+    page = render_template('notebook.html',
+                           content=Markup(_STREAM_MARKER),
+                           notebook_name=notebook_name,
+                           logo_exists=logo_exists,
+                           metadata=metadata)
+    page_head, page_tail = page.split(_STREAM_MARKER, 1)
+    webapp_prefix = g.webapp_prefix
+    
+    def generate():
+        yield page_head
+        try:
+            yield from stream_notebook_html(full_path, webapp_prefix)
+        except Exception:
+            app.logger.exception("Error renderizando %s en streaming", full_path)
+            yield "<div class='alert alert-danger'>No se pudo mostrar el notebook completo.</div>"
+        yield page_tail
+    
+    response = Response(stream_with_context(generate()), mimetype='text/html')
+    # nginx reenvía cada trozo según llega en lugar de acumular la respuesta
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Campos públicos de /api/notebooks (full_path es interno del servidor)
+_API_FIELDS = (
+    'title', 'filename', 'path', 'type', 'modified', 'modified_date', 'owner',
+    'autor', 'fecha', 'tema', 'topico', 'keywords', 'descripcion',
+)
+_API_DEFAULT_LIMIT = 50
+_API_MAX_LIMIT = 200
+# Tarjetas por página en el índice (scroll infinito)
+_INDEX_PAGE_SIZE = 24
+
+
+def _encode_cursor(record):
+    """Cursor opaco con la clave de orden del último elemento devuelto."""
+    raw = json.dumps([record['modified'], record['path']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    modified, path = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    return (-float(modified), str(path))
+
+
 @app.route('/api/notebooks')
 def api_notebooks():
-    """API para obtener notebooks con filtros"""
+    """API para obtener notebooks con filtros, paginada por cursor
+
+    Parámetros: autor, tema, keyword, fecha, search (filtros); limit (por
+    defecto 50, máx. 200); cursor (``next_cursor`` de la página anterior);
+    fields (lista separada por comas de campos a devolver).
+    La primera página (sin cursor) incluye las facetas con sus recuentos.
+    """
     # Obtener parámetros de filtro
     filtro_autor = request.args.get('autor', '').strip()
     filtro_tema = request.args.get('tema', '').strip()
     filtro_keyword = request.args.get('keyword', '').strip()
     filtro_fecha = request.args.get('fecha', '').strip()
     busqueda = request.args.get('search', '').strip().lower()
+    cursor = request.args.get('cursor', '').strip()
     
-    notebooks = []
+    try:
+        limit = int(request.args.get('limit', _API_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit debe ser un entero'}), 400
+    limit = max(1, min(limit, _API_MAX_LIMIT))
+    
+    fields_arg = request.args.get('fields', '').strip()
+    if fields_arg:
+        fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in _API_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Campos desconocidos: {', '.join(unknown)}"}), 400
+    else:
+        fields = list(_API_FIELDS)
+    
+    cursor_key = None
+    if cursor:
+        try:
+            cursor_key = _decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'cursor no válido'}), 400
+    
+    filters = dict(autor=filtro_autor, tema=filtro_tema, keyword=filtro_keyword, fecha=filtro_fecha)
+    
+    if g.get('profile') is not None:
+        # Perfil bajo demanda: sin caché
+        return app.response_class(
+            app.json.dumps(_notebooks_payload(busqueda, filters, cursor_key, limit, fields)),
+            mimetype='application/json',
+        )
     
-    # Escanear notebooks (mismo código que index)
-    shared_notebooks_dir = '/app/shared/notebooks'
-    if os.path.exists(shared_notebooks_dir):
-        for root, dirs, files in os.walk(shared_notebooks_dir):
-            if '.ipynb_checkpoints' in root:
-                continue
-                
-            for file in files:
-                if file.endswith('.ipynb') and not file.startswith('.') and 'checkpoint' not in file:
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, '/app/shared')
-                    
-                    stat_info = os.stat(full_path)
-                    modified_time = stat_info.st_mtime
-                    
-                    owner_name = "Desconocido"
-                    try:
-                        with open(full_path, 'r', encoding='utf-8') as f:
-                            nb_data = json.load(f)
-                            if 'metadata' in nb_data and 'pe_ctic' in nb_data['metadata']:
-                                owner_name = nb_data['metadata']['pe_ctic'].get('created_by', 
-                                    nb_data['metadata']['pe_ctic'].get('last_modified_by', 'Desconocido'))
-                    except:
-                        pass
-                    
-                    if owner_name == "Desconocido":
-                        owner_uid = stat_info.st_uid
-                        uid_map = {1000: 'jovyan', 0: 'root', 1005: 'agarnung'}
-                        owner_name = uid_map.get(owner_uid, f"Usuario {owner_uid}")
-                    
-                    header_metadata = parse_notebook_header(full_path)
-                    
-                    from datetime import datetime
-                    modified_date = datetime.fromtimestamp(modified_time)
-                    
-                    notebook_data = {
-                        'title': header_metadata.get('titulo', file.replace('.ipynb', '')),
-                        'filename': file.replace('.ipynb', ''),
-                        'path': rel_path,
-                        'full_path': full_path,
-                        'type': 'shared',
-                        'modified': modified_time,
-                        'modified_date': modified_date.strftime('%d/%m/%Y %H:%M'),
-                        'owner': owner_name,
-                        'autor': header_metadata.get('autor', '-'),
-                        'fecha': header_metadata.get('fecha', '-'),
-                        'tema': header_metadata.get('tema', '-'),
-                        'topico': header_metadata.get('topico', '-'),
-                        'keywords': header_metadata.get('keywords', '-'),
-                        'descripcion': header_metadata.get('descripcion', '-')
-                    }
-                    
-                    # Aplicar filtros
-                    if filtro_autor and notebook_data['autor'] != filtro_autor:
-                        continue
-                    if filtro_tema and notebook_data['tema'] != filtro_tema:
-                        continue
-                    if filtro_keyword:
-                        keywords_list = [k.strip().lower() for k in notebook_data['keywords'].split(',')]
-                        if filtro_keyword.lower() not in keywords_list:
-                            continue
-                    if filtro_fecha and notebook_data['fecha'] != filtro_fecha:
-                        continue
-                    if busqueda:
-                        search_text = f"{notebook_data['title']} {notebook_data['descripcion']} {notebook_data['topico']}".lower()
-                        if busqueda not in search_text:
-                            continue
-                    
-                    notebooks.append(notebook_data)
+    # JSON (y sus variantes comprimidas) cacheado por versión del catálogo y parámetros
+    cache_key = (_CATALOG.version, busqueda, tuple(sorted(filters.items())), cursor_key, limit, tuple(fields))
+    entry = _API_CACHE.get_entry(
+        cache_key,
+        lambda: app.json.dumps(_notebooks_payload(busqueda, filters, cursor_key, limit, fields)),
+    )
+    return _encoded_response(entry, 'application/json')
+
+def _notebooks_payload(busqueda, filters, cursor_key, limit, fields):
+    """Cuerpo de /api/notebooks para unos parámetros ya validados"""
+    # Filtrado por intersección del índice de facetas
+    records = _CATALOG.query(search=busqueda, **filters)
+    
+    # Los registros vienen ordenados por sort_key: el cursor se localiza por bisección
+    start = 0
+    if cursor_key is not None:
+        start = bisect.bisect_right(records, cursor_key, key=sort_key)
+    page = records[start:start + limit]
     
-    notebooks.sort(key=lambda x: x['modified'], reverse=True)
-    return jsonify(notebooks)
+    notebooks = []
+    for record in page:
+        notebook_data = {f: record[f] for f in fields}
+        if 'modified_date' in notebook_data:
+            notebook_data['modified_date'] = record['modified_date'].strftime('%d/%m/%Y %H:%M')
+        notebooks.append(notebook_data)
+    
+    payload = {
+        'notebooks': notebooks,
+        'total': len(records),
+        'next_cursor': _encode_cursor(page[-1]) if start + limit < len(records) else None,
+    }
+    if cursor_key is None:
+        # Número de notebooks de cada valor para los desplegables
+        payload['facets'] = _CATALOG.facets()
+    return payload
+
+@app.route('/api/prerender/status')
+def api_prerender_status():
+    """Estado del pre-renderizado: pendientes, en curso, hechos y fallos (mismo acceso que el perfilado)"""
+    # Incluye rutas absolutas del servidor y mensajes de error
+    if not _profiling_allowed():
+        return "Not Found", 404
+    if _PRERENDER is None:
+        return jsonify({'active': False, 'enabled': False})
+    status = _PRERENDER.status()
+    status['enabled'] = True
+    return jsonify(status)
+
+@app.route('/api/profiles')
+def api_profiles():
+    """Perfiles y muestras de peticiones lentas guardados (mismo acceso que el perfilado)"""
+    if not _profiling_allowed():
+        return "Not Found", 404
+    return jsonify({'profiles': _PROFILE_STORE.list()})
+
+@app.route('/api/profiles/<name>')
+def api_profile_download(name):
+    """Descarga un artefacto de perfilado (.prof, .txt, .folded o .json)"""
+    if not _profiling_allowed():
+        return "Not Found", 404
+    path = _PROFILE_STORE.path_for(name)
+    if path is None or not os.path.isfile(path):
+        return "Not Found", 404
+    return send_file(path, as_attachment=True, download_name=name,
+                     mimetype='application/octet-stream')
+
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato Prometheus, solo para la red interna
+
+    nginx no publica esta ruta; si aun así llega una petición reenviada por
+    el proxy (con ``X-Forwarded-For``), se responde como si no existiera.
+    """
+    if request.headers.get('X-Forwarded-For'):
+        return "Not Found", 404
+    CATALOG_NOTEBOOKS.set(len(_CATALOG))
+    body, content_type = exposition()
+    return Response(body, content_type=content_type)
 
 @app.route('/notebooks')
 def notebooks_list():
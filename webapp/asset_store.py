@@ -0,0 +1,183 @@
+"""
+Almacén direccionable por contenido para las imágenes embebidas en los notebooks.
+
+nbconvert incrusta cada gráfica como ``data:image/png;base64,...``, así que una
+página puede pesar decenas de MB que el navegador no cachea. ``extract_images``
+decodifica esas imágenes, las guarda una sola vez como
+``<root>/<sha256[:2]>/<sha256>.<ext>`` y sustituye el ``src`` por una URL bajo
+``/assets``, que se sirve con caché inmutable: el nombre cambia si cambia el
+contenido, y una gráfica repetida en varios notebooks se guarda una vez.
+
+El almacén se acota a ``max_bytes`` entre todos los workers, como la caché de
+renders: al superarlo (o como mucho cada minuto) se vuelve a medir el
+directorio con un ``flock`` sobre ``.evict.lock`` y se borran las imágenes
+usadas hace más tiempo. Cada extracción o petición de una imagen renueva su
+``mtime``, así que lo que se expulsa es lo de versiones antiguas o de páginas
+que nadie visita. Una página cacheada cuya imagen se ha expulsado se detecta
+al servirla (``present``) y se vuelve a renderizar, lo que extrae de nuevo
+sus imágenes.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from render_cache import _atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Solo formatos raster: un SVG servido desde nuestro origen podría ejecutar scripts
+_EXTENSIONS = {
+    "png": "png",
+    "jpeg": "jpg",
+    "jpg": "jpg",
+    "gif": "gif",
+    "webp": "webp",
+}
+MIMETYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+_DATA_SRC = re.compile(
+    r'src="data:image/(png|jpeg|jpg|gif|webp);base64,([^"]+)"', re.IGNORECASE
+)
+_ASSET_NAME = re.compile(r"^[0-9a-f]{64}\.(png|jpg|gif|webp)$")
+_ASSET_REF = re.compile(rb"/assets/([0-9a-f]{64}\.(?:png|jpg|gif|webp))")
+# Por debajo de este tamaño la petición extra cuesta más que incrustarla
+MIN_EXTRACT_BYTES = 1024
+# Cada cuánto se vuelve a medir el directorio aunque la cuenta local no supere el límite
+_RESCAN_SECONDS = 60.0
+# Una imagen en uso renueva su mtime como mucho una vez por intervalo
+_TOUCH_SECONDS = 3600.0
+
+
+class AssetStore:
+    """Imágenes por hash SHA-256 bajo ``root``, escritas de forma atómica y acotadas por bytes."""
+
+    def __init__(self, root: str, max_bytes: int = 0) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._used: int | None = None
+        self._scanned_at = 0.0
+
+    def path_for(self, name: str) -> str | None:
+        """Ruta en disco de ``name`` (``<sha256>.<ext>``) o None si el nombre no es válido."""
+        if not _ASSET_NAME.match(name):
+            return None
+        return os.path.join(self.root, name[:2], name)
+
+    def put(self, data: bytes, ext: str) -> str:
+        name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self.path_for(name)
+        if os.path.exists(path):
+            # En uso por el render en curso: que no sea lo primero en expulsarse
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return name
+        _atomic_write(path, data)
+        if self.max_bytes > 0:
+            with self._lock:
+                if self._used is not None:
+                    self._used += len(data)
+                evict = (
+                    self._used is None
+                    or self._used > self.max_bytes
+                    or time.monotonic() - self._scanned_at > _RESCAN_SECONDS
+                )
+            if evict:
+                self._evict(keep=path)
+        return name
+
+    def touch(self, path: str) -> None:
+        """Marca de uso para la expulsión LRU (como mucho una vez por hora)."""
+        try:
+            if time.time() - os.stat(path).st_mtime > _TOUCH_SECONDS:
+                os.utime(path)
+        except OSError:
+            pass
+
+    def present(self, entry) -> bool:
+        """True si existen todas las imágenes que referencia ``entry`` (un ``RenderedEntry``).
+
+        Renueva además su marca de uso, así que las imágenes de las páginas
+        que se sirven desde la caché no se expulsan.
+        """
+        if entry.assets is None:
+            entry.assets = tuple(sorted({m.decode("ascii") for m in _ASSET_REF.findall(entry.data)}))
+        for name in entry.assets:
+            path = self.path_for(name)
+            try:
+                if time.time() - os.stat(path).st_mtime > _TOUCH_SECONDS:
+                    os.utime(path)
+            except OSError:
+                return False
+        return True
+
+    def _evict(self, keep: str) -> None:
+        """Vuelve a medir el almacén y borra las imágenes más antiguas hasta quedar bajo el límite."""
+        fd = os.open(os.path.join(self.root, ".evict.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Un solo proceso mide y expulsa a la vez
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            files = []
+            used = 0
+            for current, _dirs, names in os.walk(self.root):
+                for name in names:
+                    if not _ASSET_NAME.match(name):
+                        continue
+                    path = os.path.join(current, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+                    used += st.st_size
+            if used > self.max_bytes:
+                for _mtime, size, path in sorted(files):
+                    if used <= self.max_bytes:
+                        break
+                    if path == keep:
+                        continue
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        continue
+                    used -= size
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._used = used
+            self._scanned_at = time.monotonic()
+
+    def extract_images(self, html: str, url_base: str) -> str:
+        """Sustituye las imágenes base64 de ``html`` por URLs ``url_base/<nombre>``."""
+
+        def replace(match: re.Match) -> str:
+            ext = _EXTENSIONS[match.group(1).lower()]
+            try:
+                # b64decode descarta los saltos de línea que deja nbconvert
+                data = base64.b64decode(match.group(2))
+            except (binascii.Error, ValueError):
+                return match.group(0)
+            if len(data) < MIN_EXTRACT_BYTES:
+                return match.group(0)
+            try:
+                name = self.put(data, ext)
+            except OSError as exc:
+                logger.warning("No se pudo guardar la imagen extraída: %s", exc)
+                return match.group(0)
+            return f'src="{url_base}/{name}"'
+
+        return _DATA_SRC.sub(replace, html)
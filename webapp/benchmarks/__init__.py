@@ -0,0 +1,10 @@
+"""
+Pruebas de rendimiento de la webapp sobre un corpus sintético de notebooks.
+
+Se ejecutan sin red ni servicios externos, desde ``webapp/``::
+
+    python -m benchmarks --notebooks 500 --output resultados.json
+
+El resultado es un JSON con los parámetros del corpus, el entorno y, para cada
+prueba, las estadísticas de tiempo (media, percentiles, mínimo y máximo en ms).
+"""
@@ -0,0 +1,223 @@
+"""
+Ejecuta las pruebas de rendimiento y escribe el resultado en JSON.
+
+Las cachés de renders y de la API se desactivan (salvo con ``--with-caches``)
+para medir el trabajo real de cada ruta y no una búsqueda en memoria.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from benchmarks.corpus import CorpusSpec, generate_corpus
+
+
+def _stats(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(0.50) * 1000, 3),
+        "p95_ms": round(percentile(0.95) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _measure(fn, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _stats(samples)
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    defaults = CorpusSpec()
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--root", help="Directorio del corpus (por defecto, uno temporal que se borra al acabar)")
+    parser.add_argument("--notebooks", type=int, default=defaults.notebooks)
+    parser.add_argument("--code-cells", type=int, default=defaults.code_cells)
+    parser.add_argument("--markdown-cells", type=int, default=defaults.markdown_cells)
+    parser.add_argument("--output-bytes", type=int, default=defaults.output_bytes,
+                        help="Bytes de texto en la salida de cada celda de código")
+    parser.add_argument("--images", type=int, default=defaults.images,
+                        help="Imágenes PNG embebidas por notebook")
+    parser.add_argument("--image-kb", type=int, default=defaults.image_bytes // 1024)
+    parser.add_argument("--linked-images", type=int, default=defaults.linked_images,
+                        help="Imágenes relativas por celda markdown")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeat", type=int, default=20, help="Repeticiones de cada petición")
+    parser.add_argument("--render-sample", type=int, default=3,
+                        help="Notebooks que se renderizan con nbconvert")
+    parser.add_argument("--render-repeat", type=int, default=3)
+    parser.add_argument("--with-caches", action="store_true",
+                        help="Mantener las cachés de renders y de la API")
+    parser.add_argument("--output", help="Fichero JSON de salida (por defecto, stdout)")
+    return parser.parse_args(argv)
+
+
+def _configure_environment(args: argparse.Namespace) -> None:
+    """Variables que lee app.py al importarse: sin SQLite, disco ni hilos de fondo."""
+    os.environ["WEBAPP_CATALOG_DB"] = ""
+    os.environ["WEBAPP_RENDER_CACHE_DIR"] = ""
+    os.environ["WEBAPP_PRERENDER"] = "0"
+    os.environ["WEBAPP_STREAM_MIN_MB"] = "0"
+    os.environ["WEBAPP_SLOW_REQUEST_SECONDS"] = "0"
+    if not args.with_caches:
+        os.environ["WEBAPP_RENDER_CACHE_MEMORY_MB"] = "0"
+        os.environ["WEBAPP_API_CACHE_MEMORY_MB"] = "0"
+
+
+def _top_value(facet: list[dict]) -> str:
+    return max(facet, key=lambda item: item["count"])["value"] if facet else ""
+
+
+def run(args: argparse.Namespace, root: str) -> dict:
+    spec = CorpusSpec(
+        notebooks=args.notebooks,
+        code_cells=args.code_cells,
+        markdown_cells=args.markdown_cells,
+        output_bytes=args.output_bytes,
+        images=args.images,
+        image_bytes=args.image_kb * 1024,
+        linked_images=args.linked_images,
+        seed=args.seed,
+    )
+    start = time.perf_counter()
+    paths = generate_corpus(root, spec)
+    generate_seconds = time.perf_counter() - start
+
+    _configure_environment(args)
+    import nbconvert
+    import nbformat
+
+    import app as webapp
+    from notebook_parser import parse_notebook_header
+
+    results: dict[str, dict] = {}
+
+    # Cabeceras: una muestra por notebook, con la caché de páginas ya caliente
+    for path in paths:
+        parse_notebook_header(path)
+    samples = []
+    for path in paths:
+        start = time.perf_counter()
+        parse_notebook_header(path)
+        samples.append(time.perf_counter() - start)
+    results["parse_notebook_header"] = _stats(samples)
+
+    # Catálogo completo del corpus (lo que hace el vigilante al arrancar)
+    webapp._CATALOG.root = root
+    start = time.perf_counter()
+    webapp._CATALOG.refresh()
+    results["catalog_refresh"] = _stats([time.perf_counter() - start])
+
+    client = webapp.app.test_client()
+
+    def get(url: str):
+        def request():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url}: HTTP {response.status_code}")
+        return request
+
+    results["index"] = _measure(get("/"), args.repeat)
+
+    facets = webapp._CATALOG.facets()
+    first_page = client.get("/api/notebooks").get_json()
+    autor, tema = _top_value(facets["autor"]), _top_value(facets["tema"])
+    api_cases = {
+        "api_notebooks": {},
+        "api_notebooks[autor]": {"autor": autor},
+        "api_notebooks[tema]": {"tema": tema},
+        "api_notebooks[keyword]": {"keyword": _top_value(facets["keyword"])},
+        "api_notebooks[fecha]": {"fecha": _top_value(facets["fecha"])},
+        "api_notebooks[search]": {"search": "sintético 1"},
+        "api_notebooks[autor+tema]": {"autor": autor, "tema": tema},
+        "api_notebooks[fields]": {"fields": "title,path,modified_date"},
+    }
+    if first_page["next_cursor"]:
+        api_cases["api_notebooks[cursor]"] = {"cursor": first_page["next_cursor"]}
+    for name, params in api_cases.items():
+        url = "/api/notebooks?" + urlencode(params)
+        results[name] = _measure(get(url), args.repeat)
+        results[name]["total"] = client.get(url).get_json()["total"]
+
+    # Renders de nbconvert y reescritura de rutas sobre una muestra repartida por el corpus
+    step = max(1, len(paths) // max(1, args.render_sample))
+    sample = paths[::step][:args.render_sample]
+    prefix = webapp._DEFAULT_WEBAPP_PREFIX
+    render_samples, rewrite_samples = [], []
+    with webapp.app.test_request_context("/"):
+        for path in sample:
+            for _ in range(args.render_repeat):
+                start = time.perf_counter()
+                webapp.convert_notebook_to_html(path, prefix)
+                render_samples.append(time.perf_counter() - start)
+            notebook = nbformat.read(path, as_version=4)
+            with webapp._EXPORTER_POOL.exporter() as exporter:
+                raw_html, _ = exporter.from_notebook_node(notebook)
+            notebook_dir = os.path.dirname(path)
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                webapp.fix_image_paths(raw_html, notebook_dir, prefix)
+                rewrite_samples.append(time.perf_counter() - start)
+    if render_samples:
+        results["convert_notebook_to_html"] = _stats(render_samples)
+        results["fix_image_paths"] = _stats(rewrite_samples)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "nbconvert": nbconvert.__version__,
+            "with_caches": args.with_caches,
+        },
+        "corpus": {
+            **asdict(spec),
+            "bytes": sum(os.path.getsize(path) for path in paths),
+            "generate_seconds": round(generate_seconds, 3),
+        },
+        "results": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    root = args.root or tempfile.mkdtemp(prefix="pe-ctic-bench-")
+    try:
+        report = run(args, root)
+    finally:
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
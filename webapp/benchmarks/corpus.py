@@ -0,0 +1,135 @@
+"""
+Generador de notebooks sintéticos con la cabecera de metadatos de PE-CTIC.
+
+Cada notebook lleva la celda de cabecera que lee ``parse_notebook_header``
+(título, autor, fecha, tema, tópico, keywords y descripción), celdas markdown
+con imágenes relativas (para ``fix_image_paths``) y celdas de código con
+salidas de texto de tamaño configurable e imágenes PNG embebidas en base64. Con
+la misma semilla se generan exactamente los mismos ficheros.
+"""
+from __future__ import annotations
+
+import base64
+import os
+import random
+import struct
+import zlib
+from dataclasses import dataclass
+
+import nbformat
+
+AUTORES = ["ana.garcia", "luis.perez", "marta.diaz", "jorge.ruiz", "sara.lopez", "pablo.gil"]
+TEMAS = ["1", "2", "3", "4", "5"]
+TOPICOS = ["Regresión", "Clasificación", "Series temporales", "Visualización", "Limpieza de datos"]
+KEYWORDS = ["pandas", "numpy", "sklearn", "matplotlib", "estadística", "sql", "geodatos", "nlp"]
+
+
+@dataclass
+class CorpusSpec:
+    """Parámetros del corpus (por notebook salvo ``notebooks``)."""
+
+    notebooks: int = 200
+    code_cells: int = 20
+    markdown_cells: int = 10
+    # Bytes de texto en la salida de cada celda de código
+    output_bytes: int = 2048
+    # Imágenes PNG embebidas por notebook y tamaño aproximado de cada una
+    images: int = 2
+    image_bytes: int = 64 * 1024
+    # Imágenes relativas (![...](../data/...)) por celda markdown
+    linked_images: int = 1
+    # Repartir los notebooks en subdirectorios de este tamaño (0 = todos en la raíz)
+    per_directory: int = 50
+    seed: int = 1234
+
+
+def _png(rng: random.Random, size: int) -> bytes:
+    """PNG válido de aproximadamente ``size`` bytes (ruido en escala de grises, sin comprimir)."""
+    side = max(8, int(size ** 0.5))
+    rows = b"".join(b"\x00" + rng.randbytes(side) for _ in range(side))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+        )
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows, 0)) + chunk(b"IEND", b"")
+    )
+
+
+def _header_cell(index: int, rng: random.Random) -> nbformat.NotebookNode:
+    keywords = ", ".join(rng.sample(KEYWORDS, rng.randint(1, 3)))
+    day, month = rng.randint(1, 28), rng.randint(1, 12)
+    lines = [
+        "# ------------------------------------------------------------------",
+        "# Metadata del Notebook",
+        "#",
+        f"# Título: {{Notebook sintético {index}}}",
+        f"# Autor: {{{rng.choice(AUTORES)}}}",
+        f"# Fecha: {{{day:02d}/{month:02d}/2025}}",
+        f"# Tema: {{{rng.choice(TEMAS)}}}",
+        f"# Tópico: {{{rng.choice(TOPICOS)}}}",
+        f"# Keywords: {{{keywords}}}",
+        f"# Descripción: {{Notebook {index} generado para las pruebas de rendimiento}}",
+        "# ------------------------------------------------------------------",
+    ]
+    return nbformat.v4.new_code_cell("\n".join(lines))
+
+
+def _markdown_cell(index: int, spec: CorpusSpec) -> nbformat.NotebookNode:
+    lines = [f"## Sección {index}", "", "Texto con **negrita**, `código` y una lista:", "", "- uno", "- dos"]
+    for image in range(spec.linked_images):
+        lines.append(f"![figura {image}](../data/figura_{image}.png)")
+    return nbformat.v4.new_markdown_cell("\n".join(lines))
+
+
+def _code_cell(index: int, spec: CorpusSpec, png: bytes | None) -> nbformat.NotebookNode:
+    source = f"import numpy as np\nvalores = np.arange({index})\nprint(valores.sum())"
+    line = f"resultado {index}: " + "0123456789" * 8 + "\n"
+    text = (line * (spec.output_bytes // len(line) + 1))[:spec.output_bytes]
+    outputs = [nbformat.v4.new_output("stream", name="stdout", text=text)] if text else []
+    if png is not None:
+        outputs.append(nbformat.v4.new_output(
+            "display_data",
+            data={"image/png": base64.b64encode(png).decode("ascii"), "text/plain": "<Figure>"},
+        ))
+    return nbformat.v4.new_code_cell(source, execution_count=index + 1, outputs=outputs)
+
+
+def build_notebook(index: int, spec: CorpusSpec, rng: random.Random) -> nbformat.NotebookNode:
+    cells = [_header_cell(index, rng)]
+    total = spec.code_cells + spec.markdown_cells
+    # Imágenes repartidas entre las primeras celdas de código
+    image_cells = set(range(min(spec.images, spec.code_cells)))
+    code = markdown = 0
+    for position in range(total):
+        if markdown < spec.markdown_cells and (code >= spec.code_cells or position % 3 == 0):
+            cells.append(_markdown_cell(markdown, spec))
+            markdown += 1
+        else:
+            png = _png(rng, spec.image_bytes) if code in image_cells else None
+            cells.append(_code_cell(code, spec, png))
+            code += 1
+    notebook = nbformat.v4.new_notebook(cells=cells)
+    notebook.metadata["pe_ctic"] = {"created_by": rng.choice(AUTORES)}
+    return notebook
+
+
+def generate_corpus(root: str, spec: CorpusSpec) -> list[str]:
+    """Escribe ``spec.notebooks`` notebooks bajo ``root``; devuelve sus rutas."""
+    rng = random.Random(spec.seed)
+    paths = []
+    for index in range(spec.notebooks):
+        directory = root
+        if spec.per_directory:
+            directory = os.path.join(root, f"lote_{index // spec.per_directory:03d}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"sintetico_{index:05d}.ipynb")
+        # nbformat.write: indent=1 y claves ordenadas, como los notebooks de Jupyter
+        nbformat.write(build_notebook(index, spec, rng), path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,83 @@
+"""
+Variantes precomprimidas (gzip y brotli) de las respuestas cacheadas.
+
+Las variantes se generan una vez, al construir cada entrada de caché, y en
+cada petición solo se elige la que acepta el cliente (``Accept-Encoding``).
+brotli es opcional: sin el paquete ``brotli`` solo se ofrece gzip.
+"""
+from __future__ import annotations
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional
+    brotli = None
+
+GZIP_LEVEL = 9
+# Calidad 11 apenas reduce un 8 % más y es ~20 veces más lenta
+BROTLI_QUALITY = 9
+# Por debajo de este tamaño la compresión no compensa
+MIN_COMPRESS_BYTES = 1024
+# Extensión de cada variante en disco
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def available_encodings() -> tuple[str, ...]:
+    """Codificaciones que se generan, por orden de preferencia."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0: mismo contenido, mismos bytes (y mismo ETag en proxies)
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Codificación no soportada: {encoding}")
+
+
+def compress_variants(data: bytes) -> dict[str, bytes]:
+    """Variantes de ``data`` que ocupan menos que el original."""
+    if len(data) < MIN_COMPRESS_BYTES:
+        return {}
+    variants = {}
+    for encoding in available_encodings():
+        compressed = compress(data, encoding)
+        if len(compressed) < len(data):
+            variants[encoding] = compressed
+    return variants
+
+
+def choose_encoding(accept_encoding: str, available) -> str | None:
+    """Mejor codificación de ``available`` según ``Accept-Encoding`` (None = sin comprimir).
+
+    Se respetan los pesos ``q`` (``q=0`` excluye) y ``*``; a igual peso se
+    prefiere el orden de ``available_encodings()``.
+    """
+    if not accept_encoding or not available:
+        return None
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best = None
+    best_q = 0.0
+    for encoding in available_encodings():
+        if encoding not in available:
+            continue
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
@@ -0,0 +1,92 @@
+"""
+Pool de exportadores de nbconvert configurados una sola vez.
+
+Crear un ``HTMLExporter`` reconstruye el entorno Jinja, busca la plantilla y
+carga sus recursos: cuesta más que renderizar un notebook pequeño. Aquí se
+crean como mucho ``size`` exportadores con la misma configuración y cada
+render toma uno en exclusiva (un exportador no es seguro entre hilos). Con
+varios procesos, cada worker tiene su propio pool.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class ExporterPool:
+    """Exportadores reutilizables, creados bajo demanda hasta ``size``."""
+
+    def __init__(self, factory: Callable[[], Any], size: int = 4) -> None:
+        self.factory = factory
+        self.size = max(1, size)
+        # LIFO: se reutilizan primero los exportadores usados más recientemente.
+        # Quien espera despierta cuando vuelve uno o cuando se descarta uno (y
+        # entonces crea el sustituto)
+        self._cond = threading.Condition()
+        self._idle: list[Any] = []
+        self._created = 0
+
+    def _acquire(self) -> Any:
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self.factory()
+        except BaseException:
+            self._discard()
+            raise
+
+    def _release(self, exporter: Any) -> None:
+        with self._cond:
+            self._idle.append(exporter)
+            self._cond.notify()
+
+    def _discard(self) -> None:
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def exporter(self) -> Iterator[Any]:
+        """Exportador en uso exclusivo durante el bloque ``with``."""
+        exporter = self._acquire()
+        try:
+            yield exporter
+        except BaseException:
+            # Tras un error el estado del exportador es incierto: se sustituye
+            self._discard()
+            raise
+        else:
+            self._release(exporter)
+
+    def warm(self, notebook: Any) -> None:
+        """Crea todos los exportadores y renderiza ``notebook`` con cada uno.
+
+        El primer render carga plantillas y filtros; hacerlo al arrancar lo
+        saca de la primera petición.
+        """
+        held = []
+        try:
+            while True:
+                with self._cond:
+                    if self._created >= self.size:
+                        break
+                    self._created += 1
+                try:
+                    exporter = self.factory()
+                    exporter.from_notebook_node(notebook)
+                except Exception as exc:
+                    self._discard()
+                    logger.warning("No se pudo precalentar un exportador: %s", exc)
+                    break
+                held.append(exporter)
+        finally:
+            for exporter in held:
+                self._release(exporter)
@@ -0,0 +1,75 @@
+"""
+Resolución de las rutas de ``/files/<ruta>`` a ficheros de shared/ o users/.
+
+Cada ruta se normaliza y se confina a su raíz (también tras resolver enlaces
+simbólicos), así que ``..`` codificado o un enlace que salga del árbol dan
+404. El resultado, positivo o negativo, se cachea ``ttl`` segundos: las
+peticiones repetidas (imágenes de un notebook, recargas) no repiten los
+``stat`` de cada raíz.
+"""
+from __future__ import annotations
+
+import os
+import posixpath
+import threading
+import time
+
+DEFAULT_ROOTS = (("shared", "/app/shared"), ("users", "/app/users"))
+
+
+class FileResolver:
+    """``resolve(ruta)`` -> (nombre de raíz, ruta relativa normalizada, ruta absoluta) o None."""
+
+    def __init__(
+        self,
+        roots: tuple[tuple[str, str], ...] = DEFAULT_ROOTS,
+        ttl: float = 10.0,
+        max_entries: int = 8192,
+    ) -> None:
+        self.roots = roots
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[float, tuple[str, str, str] | None]] = {}
+
+    @staticmethod
+    def normalize(file_path: str) -> str | None:
+        """Ruta relativa sin ``.``/``..``; None si intenta salir de la raíz."""
+        if "\0" in file_path or "\\" in file_path:
+            return None
+        rel_path = posixpath.normpath("/" + file_path).lstrip("/")
+        if not rel_path or rel_path == ".":
+            return None
+        # normpath sobre una ruta absoluta ya descarta los ".." iniciales; se
+        # rechazan igualmente para no servir otra ruta distinta de la pedida
+        if ".." in file_path.split("/"):
+            return None
+        return rel_path
+
+    def _lookup(self, rel_path: str) -> tuple[str, str, str] | None:
+        for name, root in self.roots:
+            full_path = os.path.join(root, rel_path)
+            if not os.path.isfile(full_path):
+                continue
+            real_root = os.path.realpath(root)
+            if os.path.realpath(full_path).startswith(real_root + os.sep):
+                return name, rel_path, full_path
+        return None
+
+    def resolve(self, file_path: str) -> tuple[str, str, str] | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_path)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        rel_path = self.normalize(file_path)
+        result = self._lookup(rel_path) if rel_path is not None else None
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[file_path] = (now, result)
+        return result
+
+    def forget(self, file_path: str) -> None:
+        with self._lock:
+            self._entries.pop(file_path, None)
@@ -0,0 +1,67 @@
+# webapp/gunicorn.conf.py
+"""
+Configuración de gunicorn para servir la webapp en producción.
+
+Varios procesos (renders de nbconvert en paralelo, sin GIL compartido) con
+varios hilos cada uno (las peticiones ligeras no esperan tras un render). La
+aplicación se precarga en el maestro: nbconvert, Jinja, Pygments y los
+exportadores precalentados se importan una vez y los workers los heredan al
+hacer fork. Los hilos de la app (vigilante del catálogo, pre-renderizado) y la
+conexión SQLite se crean ya dentro de cada worker.
+
+Recarga sin cortes: ``docker compose kill -s HUP webapp`` sustituye los workers
+uno a uno tras terminar sus peticiones en curso. Con la app precargada, el
+código nuevo solo se carga reiniciando el contenedor (o con
+``WEBAPP_PRELOAD=0``, en cuyo caso HUP también recarga el código).
+
+Las métricas de Prometheus de todos los workers se agregan a través de
+``PROMETHEUS_MULTIPROC_DIR``, que debe fijarse antes de importar la app.
+"""
+import multiprocessing
+import os
+import shutil
+
+_METRICS_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/webapp-metrics")
+# Se vacía al arrancar el maestro, antes de precargar la app, y no en cada HUP
+# (que vuelve a leer este fichero): los contadores empiezan de cero
+if os.environ.get("WEBAPP_METRICS_MASTER_PID") != str(os.getpid()):
+    os.environ["WEBAPP_METRICS_MASTER_PID"] = str(os.getpid())
+    shutil.rmtree(_METRICS_DIR, ignore_errors=True)
+    os.makedirs(_METRICS_DIR, exist_ok=True)
+
+bind = os.getenv("WEBAPP_BIND", "0.0.0.0:80")
+
+# Cada worker puede ocupar cientos de MB al renderizar: por defecto, uno por CPU (máx. 4)
+workers = int(os.getenv("WEBAPP_WORKERS", str(min(multiprocessing.cpu_count(), 4))))
+threads = int(os.getenv("WEBAPP_THREADS", "4"))
+worker_class = "gthread"
+
+preload_app = os.getenv("WEBAPP_PRELOAD", "1").strip() == "1"
+
+# Reciclado de workers tras N peticiones (con jitter para que no coincidan):
+# acota la memoria que nbconvert va acumulando (0 = desactivado)
+max_requests = int(os.getenv("WEBAPP_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("WEBAPP_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+
+# Un notebook grande sin cachear puede tardar en renderizarse
+timeout = int(os.getenv("WEBAPP_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEBAPP_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("WEBAPP_LOG_LEVEL", "info")
+
+
+def child_exit(server, worker):
+    """Los gauges ``live*`` dejan de contar los workers que ya no existen."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """Arranca el catálogo en cada worker nada más crearse, no en su primera petición."""
+    import app as webapp
+
+    webapp._start_catalog_watcher()
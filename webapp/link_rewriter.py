@@ -0,0 +1,168 @@
+"""
+Reescritura de las rutas de imágenes del HTML renderizado hacia /files.
+
+Una sola pasada por el HTML reconoce los atributos ``src`` y ``srcset``; cada
+URL relativa o del sistema de ficheros de Jupyter se traduce a la ruta web
+equivalente. Comprobar si un fichero existe no hace un ``stat`` por imagen: se
+consulta el listado de su directorio, que se cachea unos segundos
+(``DirectoryCache``), así que las imágenes repetidas no repiten llamadas al
+sistema.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+
+SHARED_ROOT = "/app/shared"
+USERS_ROOT = "/app/users"
+LEGACY_FILES_BASE = "/pe-ctic/webapp/files"
+
+# src="..." y srcset="..." (también data-src, como hacía la versión anterior)
+_ATTRIBUTE = re.compile(r'\b(srcset|src)="([^"]*)"')
+# srcset (HTML): separadores, URL sin espacios (las comas finales separan) y
+# descriptores opcionales ("2x", "480w") hasta la siguiente coma
+_SRCSET_SEPARATOR = re.compile(r"[\s,]*")
+_SRCSET_URL = re.compile(r"\S+")
+_SRCSET_DESCRIPTORS = re.compile(r"[^,]*,?")
+
+
+class DirectoryCache:
+    """Nombres de cada directorio, cacheados ``ttl`` segundos."""
+
+    def __init__(self, ttl: float = 30.0, max_dirs: int = 4096) -> None:
+        self.ttl = ttl
+        self.max_dirs = max_dirs
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[float, frozenset[str]]] = {}
+
+    def _listing(self, directory: str) -> frozenset[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(directory)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        try:
+            names = frozenset(os.listdir(directory))
+        except OSError:
+            names = frozenset()
+        with self._lock:
+            if len(self._entries) >= self.max_dirs:
+                self._entries.clear()
+            self._entries[directory] = (now, names)
+        return names
+
+    def exists(self, path: str) -> bool:
+        directory, name = os.path.split(path)
+        return bool(name) and name in self._listing(directory)
+
+
+def _split_srcset(value: str) -> list[tuple[str, str, str]]:
+    """Candidatos de ``srcset`` como (separador previo, url, descriptores)."""
+    candidates = []
+    pos = 0
+    while pos < len(value):
+        lead = _SRCSET_SEPARATOR.match(value, pos)
+        url = _SRCSET_URL.match(value, lead.end())
+        if url is None:
+            candidates.append((lead.group(0), "", ""))
+            break
+        bare = url.group(0).rstrip(",")
+        if len(bare) < len(url.group(0)):
+            candidates.append((lead.group(0), bare, url.group(0)[len(bare):]))
+            pos = url.end()
+            continue
+        rest = _SRCSET_DESCRIPTORS.match(value, url.end())
+        candidates.append((lead.group(0), bare, rest.group(0)))
+        pos = rest.end()
+    return candidates
+
+
+class LinkRewriter:
+    """Traduce las URLs de imágenes de un notebook de ``notebook_dir``."""
+
+    def __init__(self, notebook_dir: str, files_base: str, directories: DirectoryCache) -> None:
+        self.files_base = files_base
+        self.directories = directories
+        # Determinar si el notebook está en shared o users
+        if SHARED_ROOT in notebook_dir:
+            self.base_path = SHARED_ROOT
+            self.rel_dir = os.path.relpath(notebook_dir, SHARED_ROOT)
+        elif USERS_ROOT in notebook_dir:
+            self.base_path = USERS_ROOT
+            self.rel_dir = os.path.relpath(notebook_dir, USERS_ROOT)
+        else:
+            self.base_path = None
+            self.rel_dir = ""
+
+    def rewrite_url(self, url: str) -> str | None:
+        """Ruta web para ``url``, o None si se deja como está."""
+        files_base = self.files_base
+
+        # NO tocar imágenes base64 ni URLs HTTP/HTTPS
+        if url.startswith("data:") or url.startswith("http://") or url.startswith("https://"):
+            return None
+
+        # Ya es una ruta web de la aplicación (prefijo actual o legado)
+        if url.startswith(files_base + "/") or url == files_base:
+            return None
+        if url.startswith(LEGACY_FILES_BASE + "/") or url.startswith("/files/"):
+            return None
+
+        # Ruta absoluta del sistema de archivos de Jupyter
+        if url.startswith("/"):
+            for root in ("shared", "users"):
+                for jupyter_root in (f"/home/jovyan/{root}/", f"/home/{root}/"):
+                    if jupyter_root in url:
+                        rel_path = (
+                            url.replace(f"/home/jovyan/{root}/", "")
+                            .replace(f"/home/{root}/", "")
+                            .lstrip("/")
+                        )
+                        return f"{files_base}/{rel_path}"
+            # Si no es de shared/users, dejar como está
+            return None
+
+        # Ruta relativa: resolverla desde el directorio del notebook
+        if self.base_path and self.rel_dir:
+            resolved = os.path.normpath(os.path.join(self.base_path, self.rel_dir, url))
+            if resolved.startswith(SHARED_ROOT + "/"):
+                if self.directories.exists(resolved):
+                    return f"{files_base}/{resolved[len(SHARED_ROOT) + 1:]}"
+            elif resolved.startswith(USERS_ROOT + "/"):
+                if self.directories.exists(resolved):
+                    return f"{files_base}/{resolved[len(USERS_ROOT) + 1:]}"
+            else:
+                # La ruta sale de shared/users: buscarla en ambos
+                for root in (SHARED_ROOT, USERS_ROOT):
+                    candidate = os.path.normpath(os.path.join(root, url.lstrip("/")))
+                    if candidate.startswith(root + "/") and self.directories.exists(candidate):
+                        return f"{files_base}/{candidate[len(root) + 1:]}"
+
+        # Si no se puede resolver, usar la ruta limpia (puede que ya sea la correcta)
+        clean_path = os.path.normpath(url).replace("\\", "/").lstrip("/")
+        return f"{files_base}/{clean_path}"
+
+    def _rewrite_srcset(self, value: str) -> str:
+        if value.lstrip().startswith("data:"):
+            return value
+        parts = []
+        for lead, url, rest in _split_srcset(value):
+            parts.append(lead + ((self.rewrite_url(url) or url) if url else "") + rest)
+        return "".join(parts)
+
+    def rewrite(self, html: str) -> str:
+        """Reescribe todos los ``src``/``srcset`` de ``html`` en una pasada."""
+
+        def replace(match: re.Match) -> str:
+            attribute, value = match.group(1), match.group(2)
+            if attribute == "srcset":
+                new_value = self._rewrite_srcset(value)
+            else:
+                new_value = self.rewrite_url(value) if value else None
+            if new_value is None or new_value == value:
+                return match.group(0)
+            return f'{attribute}="{new_value}"'
+
+        return _ATTRIBUTE.sub(replace, html)
@@ -0,0 +1,84 @@
+"""
+Métricas de la webapp en formato Prometheus (``GET /metrics``).
+
+- Latencia de las peticiones por ruta (la regla de Flask, no la URL), método y estado.
+- Duración de cada fase: ``scan`` (recorrido del catálogo), ``parse`` (cabeceras
+  de notebooks), ``render`` (nbconvert) y ``rewrite`` (rutas de imágenes y
+  extracción de assets).
+- Consultas a las cachés por resultado (``memory``, ``disk``, ``inflight``,
+  ``miss``), de las que sale la tasa de aciertos, y tamaño del catálogo.
+
+Con varios workers de gunicorn, ``PROMETHEUS_MULTIPROC_DIR`` (lo fija
+gunicorn.conf.py antes de importar la app) hace que cada proceso escriba sus
+valores en ese directorio y ``/metrics`` los agregue, responda el worker que
+responda.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+# De parseos de milisegundos a renders de notebooks grandes
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram(
+    "webapp_request_duration_seconds",
+    "Duración de las peticiones hasta generar la respuesta",
+    ["route", "method", "status"],
+    buckets=_BUCKETS,
+)
+PHASE_LATENCY = Histogram(
+    "webapp_phase_duration_seconds",
+    "Duración de cada fase del catálogo y del render",
+    ["phase"],
+    buckets=_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "webapp_cache_lookups_total",
+    "Consultas a las cachés por resultado",
+    ["cache", "result"],
+)
+CATALOG_NOTEBOOKS = Gauge(
+    "webapp_catalog_notebooks",
+    "Notebooks en el catálogo",
+    multiprocess_mode="livemax",
+)
+
+
+@contextmanager
+def timed(phase: str):
+    """Observa la duración del bloque en ``webapp_phase_duration_seconds{phase=...}``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_LATENCY.labels(phase).observe(time.perf_counter() - start)
+
+
+def cache_observer(cache: str):
+    """Callback para ``RenderCache(observer=...)``: cuenta cada consulta de ``cache``."""
+
+    def observe(result: str) -> None:
+        CACHE_LOOKUPS.labels(cache, result).inc()
+
+    return observe
+
+
+def observe_request(route: str, method: str, status: int, seconds: float) -> None:
+    REQUEST_LATENCY.labels(route, method, str(status)).observe(seconds)
+
+
+def exposition() -> tuple[bytes, str]:
+    """Cuerpo y Content-Type de ``/metrics`` (agregando todos los procesos si procede)."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,403 @@
+"""
+Catálogo de notebooks compartidos con refresco incremental.
+
+Mantiene un registro por notebook de /app/shared/notebooks, asociado a su firma
+de stat ``(mtime, size, inode)``. Cada refresco recorre el árbol haciendo solo
+``stat``; únicamente los notebooks nuevos o cuya firma ha cambiado se vuelven a
+leer y parsear. ``notebook_watcher`` aplica además los eventos de inotify
+entrada a entrada (``update_path`` / ``remove_path``) y ``notebook_store``
+persiste los registros en SQLite para compartirlos entre workers.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from metrics import timed
+from notebook_parser import parse_notebook_summary
+from notebook_store import NotebookStore
+
+logger = logging.getLogger(__name__)
+
+SHARED_DIR = "/app/shared"
+NOTEBOOKS_DIR = "/app/shared/notebooks"
+
+# UIDs conocidos cuando el notebook no trae metadata pe_ctic
+_UID_MAP = {1000: "jovyan", 0: "root", 1005: "agarnung"}
+
+# Facetas filtrables; keyword se indexa en minúsculas (el filtro no distingue mayúsculas)
+FACETS = ("autor", "tema", "keyword", "fecha")
+
+
+def is_catalog_notebook(filename: str) -> bool:
+    """Notebooks visibles en la webapp (sin ocultos ni checkpoints)."""
+    return (
+        filename.endswith(".ipynb")
+        and not filename.startswith(".")
+        and "checkpoint" not in filename
+    )
+
+
+def stat_signature(stat_info: os.stat_result) -> tuple[float, int, int]:
+    """Firma que invalida el registro: (mtime, tamaño, inodo)."""
+    return (stat_info.st_mtime, stat_info.st_size, stat_info.st_ino)
+
+
+def notebook_owner(pe_ctic: dict | None, stat_info: os.stat_result) -> str:
+    """Propietario desde metadata.pe_ctic; si no hay, UID del fichero."""
+    owner_name = "Desconocido"
+    if pe_ctic:
+        owner_name = pe_ctic.get(
+            "created_by", pe_ctic.get("last_modified_by", "Desconocido")
+        )
+
+    if owner_name == "Desconocido":
+        owner_uid = stat_info.st_uid
+        owner_name = _UID_MAP.get(owner_uid, f"Usuario {owner_uid}")
+    return owner_name
+
+
+def build_notebook_record(full_path: str, stat_info: os.stat_result) -> dict:
+    """Registro del catálogo para un notebook (una sola lectura incremental)."""
+    file = os.path.basename(full_path)
+    with timed("parse"):
+        header_metadata, pe_ctic = parse_notebook_summary(full_path)
+    modified_time = stat_info.st_mtime
+    return {
+        "title": header_metadata.get("titulo", file.replace(".ipynb", "")),
+        "filename": file.replace(".ipynb", ""),
+        "path": os.path.relpath(full_path, SHARED_DIR),
+        "full_path": full_path,
+        "type": "shared",
+        "modified": modified_time,
+        "modified_date": datetime.fromtimestamp(modified_time),
+        "owner": notebook_owner(pe_ctic, stat_info),
+        "autor": header_metadata.get("autor", "-"),
+        "fecha": header_metadata.get("fecha", "-"),
+        "tema": header_metadata.get("tema", "-"),
+        "topico": header_metadata.get("topico", "-"),
+        "keywords": header_metadata.get("keywords", "-"),
+        "descripcion": header_metadata.get("descripcion", "-"),
+    }
+
+
+def facet_values(record: dict) -> dict[str, list[str]]:
+    """Valores de cada faceta para un registro (sin los '-' de campos vacíos)."""
+    values = {
+        facet: [record[facet]] if record[facet] != "-" else []
+        for facet in ("autor", "tema", "fecha")
+    }
+    keywords = []
+    if record["keywords"] != "-":
+        keywords = [k.strip() for k in record["keywords"].split(",") if k.strip()]
+    values["keyword"] = keywords
+    return values
+
+
+def _facet_key(facet: str, value: str) -> str:
+    return value.lower() if facet == "keyword" else value
+
+
+def sort_key(record: dict) -> tuple[float, str]:
+    """Orden del catálogo: más recientes primero y ruta como desempate (estable para cursores)."""
+    return (-record["modified"], record["path"])
+
+
+def _search_text(record: dict) -> str:
+    return f"{record['title']} {record['descripcion']} {record['topico']}".lower()
+
+
+def _scan_notebooks(root: str, found: dict[str, os.stat_result]) -> None:
+    """Recorre ``root`` con scandir y anota el stat de cada notebook."""
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    # Excluir directorios de checkpoints (y todo lo que cuelga)
+                    if entry.name != ".ipynb_checkpoints" and not entry.is_symlink():
+                        _scan_notebooks(entry.path, found)
+                elif is_catalog_notebook(entry.name):
+                    found[entry.path] = entry.stat()
+            except OSError:
+                continue
+
+
+class NotebookCatalog:
+    """Registros de notebooks compartidos, refrescados por firma de stat.
+
+    Con ``store`` los registros se cargan de SQLite al arrancar y, si este
+    proceso es el actualizador (``writable``), cada cambio se persiste allí;
+    el resto de workers se sincronizan con ``sync_from_store``.
+    """
+
+    def __init__(self, root: str = NOTEBOOKS_DIR, store: NotebookStore | None = None) -> None:
+        self.root = root
+        self.store = store
+        self.writable = store is None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._records: dict[str, dict] = {}
+        self._signatures: dict[str, tuple[float, int, int]] = {}
+        self._sorted: list[dict] | None = None
+        self._store_version: int | None = None
+        # Índice invertido faceta -> clave -> rutas, etiqueta visible por clave y
+        # texto de búsqueda precalculado; se mantienen en _apply.
+        self._facet_index: dict[str, dict[str, set[str]]] = {f: {} for f in FACETS}
+        self._facet_labels: dict[str, dict[str, str]] = {f: {} for f in FACETS}
+        self._facet_counts: dict[str, list[dict]] | None = None
+        self._search: dict[str, str] = {}
+        self._listeners: list = []
+        # Avanza con cada cambio aplicado (clave de las respuestas cacheadas de la API)
+        self.version = 0
+
+    def _apply(
+        self,
+        upserts: list[tuple[str, tuple[float, int, int], dict]],
+        deletes: list[str],
+        persist: bool = True,
+    ) -> None:
+        """Único punto de mutación: memoria y, si procede, SQLite."""
+        if not upserts and not deletes:
+            return
+        with self._lock:
+            for full_path in deletes:
+                self._unindex(full_path)
+                self._records.pop(full_path, None)
+                self._signatures.pop(full_path, None)
+            for full_path, signature, record in upserts:
+                self._unindex(full_path)
+                self._records[full_path] = record
+                self._signatures[full_path] = signature
+                self._index(full_path, record)
+            self._sorted = None
+            self._facet_counts = None
+            self.version += 1
+        if persist and self.store is not None and self.writable:
+            try:
+                self.store.apply([(r, sig) for _, sig, r in upserts], deletes)
+            except sqlite3.Error as exc:
+                logger.warning("No se pudo persistir el catálogo: %s", exc)
+        changed = [full_path for full_path, _, _ in upserts]
+        for listener in self._listeners:
+            try:
+                listener(changed, deletes)
+            except Exception:
+                logger.exception("Error notificando cambios del catálogo")
+
+    def add_listener(self, callback) -> None:
+        """``callback(rutas_cambiadas, rutas_borradas)`` tras cada cambio aplicado."""
+        self._listeners.append(callback)
+
+    def _index(self, full_path: str, record: dict) -> None:
+        for facet, values in facet_values(record).items():
+            postings = self._facet_index[facet]
+            labels = self._facet_labels[facet]
+            for value in values:
+                key = _facet_key(facet, value)
+                postings.setdefault(key, set()).add(full_path)
+                labels.setdefault(key, value)
+        self._search[full_path] = _search_text(record)
+
+    def _unindex(self, full_path: str) -> None:
+        record = self._records.get(full_path)
+        if record is None:
+            return
+        for facet, values in facet_values(record).items():
+            postings = self._facet_index[facet]
+            for value in values:
+                key = _facet_key(facet, value)
+                paths = postings.get(key)
+                if paths is None:
+                    continue
+                paths.discard(full_path)
+                if not paths:
+                    del postings[key]
+                    self._facet_labels[facet].pop(key, None)
+        self._search.pop(full_path, None)
+
+    def load_from_store(self) -> None:
+        """Arranque en frío: registros persistidos, sin parsear notebooks.
+
+        Si la base de datos no se puede abrir se sigue solo en memoria.
+        """
+        if self.store is None:
+            return
+        try:
+            self.store.generation()
+        except (sqlite3.Error, OSError) as exc:
+            logger.warning(
+                "Catálogo persistido no disponible en %s (%s); se usa solo memoria",
+                self.store.db_path,
+                exc,
+            )
+            self.store = None
+            self.writable = True
+            return
+        self.sync_from_store(force=True)
+
+    def sync_from_store(self, force: bool = False) -> None:
+        """Recarga desde SQLite si otro proceso ha escrito desde la última vez."""
+        if self.store is None:
+            return
+        try:
+            version = self.store.generation()
+            if not force and version == self._store_version:
+                return
+            rows = self.store.load_all()
+        except sqlite3.Error as exc:
+            logger.warning("No se pudo leer el catálogo persistido: %s", exc)
+            return
+        self._store_version = version
+        with self._lock:
+            loaded = {record["full_path"]: (record, sig) for record, sig in rows}
+            deletes = [p for p in self._records if p not in loaded]
+            upserts = [
+                (full_path, sig, record)
+                for full_path, (record, sig) in loaded.items()
+                if self._signatures.get(full_path) != sig
+            ]
+        self._apply(upserts, deletes, persist=False)
+
+    def refresh(self) -> None:
+        """Sincroniza con disco: solo re-parsea entradas con firma distinta.
+
+        El parseo se hace fuera del lock de lectura para que las peticiones
+        sigan sirviendo el estado anterior mientras dura la reconciliación.
+        """
+        with self._refresh_lock:
+            found: dict[str, os.stat_result] = {}
+            if os.path.isdir(self.root):
+                with timed("scan"):
+                    _scan_notebooks(self.root, found)
+
+            with self._lock:
+                removed = [p for p in self._records if p not in found]
+                stale = [
+                    (full_path, stat_info)
+                    for full_path, stat_info in found.items()
+                    if self._signatures.get(full_path) != stat_signature(stat_info)
+                ]
+
+            fresh = [
+                (full_path, stat_signature(stat_info), build_notebook_record(full_path, stat_info))
+                for full_path, stat_info in stale
+            ]
+            self._apply(fresh, removed)
+
+    def update_path(self, full_path: str) -> None:
+        """Actualiza (o elimina) un único notebook tras un evento del sistema de ficheros."""
+        if not self._in_scope(full_path):
+            return
+        with self._refresh_lock:
+            try:
+                stat_info = os.stat(full_path)
+            except OSError:
+                self.remove_path(full_path)
+                return
+            signature = stat_signature(stat_info)
+            with self._lock:
+                if self._signatures.get(full_path) == signature:
+                    return
+            record = build_notebook_record(full_path, stat_info)
+            self._apply([(full_path, signature, record)], [])
+
+    def remove_path(self, full_path: str) -> None:
+        with self._lock:
+            if full_path not in self._records:
+                return
+        self._apply([], [full_path])
+
+    def update_tree(self, directory: str) -> None:
+        """Incorpora un directorio creado o movido dentro del árbol."""
+        found: dict[str, os.stat_result] = {}
+        _scan_notebooks(directory, found)
+        for full_path in found:
+            self.update_path(full_path)
+
+    def remove_tree(self, directory: str) -> None:
+        """Elimina los registros de un directorio borrado o movido fuera."""
+        prefix = directory.rstrip("/") + "/"
+        with self._lock:
+            gone = [p for p in self._records if p.startswith(prefix)]
+        self._apply([], gone)
+
+    def _in_scope(self, full_path: str) -> bool:
+        rel = os.path.relpath(full_path, self.root)
+        if rel.startswith(".."):
+            return False
+        parts = rel.split(os.sep)
+        return ".ipynb_checkpoints" not in parts[:-1] and is_catalog_notebook(parts[-1])
+
+    def get(self, full_path: str) -> dict | None:
+        with self._lock:
+            return self._records.get(full_path)
+
+    def records(self) -> list[dict]:
+        """Registros ordenados por ``sort_key`` (más recientes primero).
+
+        La lista y los dicts son compartidos entre peticiones: no mutarlos.
+        """
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self._records.values(), key=sort_key)
+            return self._sorted
+
+    def query(self, search: str = "", **filters: str) -> list[dict]:
+        """Registros que cumplen los filtros de faceta (intersección de conjuntos).
+
+        ``filters`` admite las claves de ``FACETS``; ``search`` busca (sin
+        distinguir mayúsculas) en título, descripción y tópico.
+        """
+        records = self.records()
+        with self._lock:
+            postings = []
+            for facet, value in filters.items():
+                if not value:
+                    continue
+                paths = self._facet_index[facet].get(_facet_key(facet, value))
+                if not paths:
+                    return []
+                postings.append(paths)
+            if postings:
+                postings.sort(key=len)
+                ids = set(postings[0]).intersection(*postings[1:])
+            else:
+                ids = None
+            if search:
+                needle = search.lower()
+                candidates = ids if ids is not None else self._search.keys()
+                ids = {p for p in candidates if needle in self._search[p]}
+
+        if ids is None:
+            return records
+        if len(ids) * 4 < len(records):
+            selected = [r for r in map(self._records.get, ids) if r is not None]
+            selected.sort(key=sort_key)
+            return selected
+        return [r for r in records if r["full_path"] in ids]
+
+    def facets(self) -> dict[str, list[dict]]:
+        """Valores de cada faceta con su número de notebooks, ordenados por valor."""
+        with self._lock:
+            if self._facet_counts is None:
+                self._facet_counts = {
+                    facet: sorted(
+                        (
+                            {"value": self._facet_labels[facet][key], "count": len(paths)}
+                            for key, paths in postings.items()
+                        ),
+                        key=lambda item: item["value"],
+                    )
+                    for facet, postings in self._facet_index.items()
+                }
+            return self._facet_counts
+
+    def __len__(self) -> int:
+        return len(self._records)
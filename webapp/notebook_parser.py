@@ -1,13 +1,259 @@
 """
 Parser para extraer metadata de notebooks PE-CTIC
 """
-import re
 import json
+import mmap
+import re
 
-def parse_notebook_header(notebook_path):
+# Celdas iniciales en las que se busca la cabecera de metadatos
+HEADER_CELLS = 3
+
+# Tokens JSON a nivel de bytes (UTF-8 nunca usa '"' ni '\' dentro de un carácter multibyte)
+_WS = re.compile(rb'[ \t\r\n]*')
+# Fuera de cadenas solo interesan comillas, corchetes y llaves
+_STRUCTURAL = re.compile(rb'["\[\]{}]')
+_SCALAR = re.compile(rb'[^,\]}\s]+')
+# nbformat escribe con indent=1 y claves ordenadas: "metadata" de primer nivel va tras
+# todas las celdas. Un salto de línea literal no puede aparecer dentro de una cadena
+# JSON, así que este patrón solo casa con la clave de primer nivel.
+_TOP_LEVEL_METADATA = b'\n "metadata": '
+
+
+def _empty_header():
+    return {
+        'titulo': '-',
+        'autor': '-',
+        'fecha': '-',
+        'tema': '-',
+        'topico': '-',
+        'keywords': '-',
+        'descripcion': '-'
+    }
+
+
+class _StopReading(Exception):
+    """Ya se tiene todo lo necesario: no seguir recorriendo el fichero."""
+
+
+class _HeadReader:
+    """
+    Recorre el JSON de un notebook sin materializar los valores que no necesita.
+
+    Los valores saltados (outputs con imágenes base64, HTML de dataframes...)
+    solo se atraviesan con expresiones regulares sobre el buffer; únicamente se
+    decodifican los valores que piden los callbacks.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def ws(self, pos):
+        return _WS.match(self.buf, pos).end()
+
+    def _char(self, pos):
+        return self.buf[pos:pos + 1]
+
+    def skip_value(self, pos):
+        """Posición justo después del valor JSON que empieza en ``pos``."""
+        pos = self.ws(pos)
+        first = self._char(pos)
+        if first == b'"':
+            return self._skip_string(pos)
+        if first not in (b'{', b'['):
+            match = _SCALAR.match(self.buf, pos)
+            if not match:
+                raise ValueError(f"Valor JSON esperado en byte {pos}")
+            return match.end()
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(self.buf, pos)
+            if not match:
+                raise ValueError(f"JSON truncado en byte {pos}")
+            token = match.group(0)
+            if token == b'"':
+                pos = self._skip_string(match.start())
+                continue
+            pos = match.end()
+            if token in (b'{', b'['):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+
+    def _skip_string(self, pos):
+        """Fin de la cadena que abre en ``pos``.
+
+        Se usa ``find`` (memchr) en lugar de una regex carácter a carácter:
+        las cadenas largas (base64, HTML) son la mayor parte del fichero.
+        """
+        buf = self.buf
+        end = pos + 1
+        while True:
+            quote = buf.find(b'"', end)
+            if quote < 0:
+                raise ValueError(f"Cadena sin cerrar en byte {pos}")
+            backslash = quote - 1
+            while buf[backslash] == 0x5C:
+                backslash -= 1
+            if (quote - 1 - backslash) % 2 == 0:
+                return quote + 1
+            end = quote + 1
+
+    def read_value(self, pos):
+        """Decodifica el valor que empieza en ``pos``; devuelve (valor, fin)."""
+        start = self.ws(pos)
+        end = self.skip_value(start)
+        return json.loads(bytes(self.buf[start:end])), end
+
+    def read_object(self, pos, on_member):
+        """
+        Recorre los miembros del objeto en ``pos``.
+
+        ``on_member(clave, pos_valor)`` devuelve el fin del valor si lo ha
+        consumido, o None para saltarlo. Devuelve la posición tras el '}'.
+        """
+        pos = self.ws(pos)
+        if self._char(pos) != b'{':
+            raise ValueError(f"Objeto JSON esperado en byte {pos}")
+        pos = self.ws(pos + 1)
+        if self._char(pos) == b'}':
+            return pos + 1
+        while True:
+            key_end = self._skip_string(pos)
+            key = json.loads(bytes(self.buf[pos:key_end]))
+            pos = self.ws(key_end)
+            if self._char(pos) != b':':
+                raise ValueError(f"':' esperado en byte {pos}")
+            value_pos = self.ws(pos + 1)
+            end = on_member(key, value_pos)
+            pos = self.ws(end if end is not None else self.skip_value(value_pos))
+            sep = self._char(pos)
+            if sep == b'}':
+                return pos + 1
+            if sep != b',':
+                raise ValueError(f"',' o '}}' esperado en byte {pos}")
+            pos = self.ws(pos + 1)
+
+    def read_array(self, pos, on_element):
+        """Igual que ``read_object`` para arrays: ``on_element(indice, pos_valor)``."""
+        pos = self.ws(pos)
+        if self._char(pos) != b'[':
+            raise ValueError(f"Array JSON esperado en byte {pos}")
+        pos = self.ws(pos + 1)
+        if self._char(pos) == b']':
+            return pos + 1
+        index = 0
+        while True:
+            end = on_element(index, pos)
+            pos = self.ws(end if end is not None else self.skip_value(pos))
+            sep = self._char(pos)
+            if sep == b']':
+                return pos + 1
+            if sep != b',':
+                raise ValueError(f"',' o ']' esperado en byte {pos}")
+            pos = self.ws(pos + 1)
+            index += 1
+
+
+def read_notebook_head(notebook_path, max_cells=HEADER_CELLS):
+    """
+    Lectura incremental de la parte del notebook que usa la webapp.
+
+    Devuelve ``(pe_ctic, sources)``: el dict ``metadata.pe_ctic`` (o None) y el
+    ``source`` de las primeras ``max_cells`` celdas. El fichero se mapea en
+    memoria y los outputs se atraviesan sin decodificarse, así que la memoria
+    no depende del tamaño de los outputs. En cuanto se tienen ``metadata`` y
+    las celdas necesarias se deja de leer; con ficheros escritos por nbformat
+    ``metadata`` se localiza al final y no hace falta recorrer el resto de celdas.
+    """
+    with open(notebook_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            reader = _HeadReader(buf)
+            found = {'pe_ctic': None, 'metadata': False, 'cells': False}
+            sources = []
+
+            def on_cell_member(key, pos):
+                if key != 'source':
+                    return None
+                source, end = reader.read_value(pos)
+                if isinstance(source, list):
+                    source = ''.join(source)
+                sources[-1] = source if isinstance(source, str) else ''
+                return end
+
+            def on_cell(index, pos):
+                if index >= max_cells:
+                    if found['metadata']:
+                        raise _StopReading
+                    return None
+                sources.append('')
+                return reader.read_object(pos, on_cell_member)
+
+            def on_metadata_member(key, pos):
+                if key != 'pe_ctic':
+                    return None
+                found['pe_ctic'], end = reader.read_value(pos)
+                return end
+
+            def on_top_member(key, pos):
+                if key == 'metadata' and found['metadata']:
+                    return None
+                if key == 'cells':
+                    end = reader.read_array(pos, on_cell)
+                    found['cells'] = True
+                elif key == 'metadata':
+                    end = reader.read_object(pos, on_metadata_member)
+                    found['metadata'] = True
+                else:
+                    return None
+                if found['cells'] and found['metadata']:
+                    raise _StopReading
+                return end
+
+            def read_tail_metadata():
+                # Atajo para ficheros de nbformat: leer metadata desde el final y
+                # validar que tras ella solo quedan miembros de primer nivel.
+                start = buf.rfind(_TOP_LEVEL_METADATA)
+                if start < 0:
+                    return False
+                holder = {}
+
+                def on_member(key, pos):
+                    if key != 'pe_ctic':
+                        return None
+                    holder['pe_ctic'], end = reader.read_value(pos)
+                    return end
+
+                try:
+                    pos = reader.ws(reader.read_object(start + len(_TOP_LEVEL_METADATA), on_member))
+                    while reader.buf[pos:pos + 1] == b',':
+                        pos = reader.ws(reader._skip_string(reader.ws(pos + 1)))
+                        if reader.buf[pos:pos + 1] != b':':
+                            return False
+                        pos = reader.ws(reader.skip_value(pos + 1))
+                    if reader.buf[pos:pos + 1] != b'}' or reader.ws(pos + 1) != len(buf):
+                        return False
+                except ValueError:
+                    return False
+                found['pe_ctic'] = holder.get('pe_ctic')
+                found['metadata'] = True
+                return True
+
+            read_tail_metadata()
+            try:
+                reader.read_object(0, on_top_member)
+            except _StopReading:
+                pass
+
+    pe_ctic = found['pe_ctic'] if isinstance(found['pe_ctic'], dict) else None
+    return pe_ctic, sources
+
+
+def parse_header_sources(sources):
     """
-    Extrae metadata de la cabecera del notebook
-    
+    Extrae metadata de la cabecera a partir del source de las primeras celdas
+
     Formato esperado:
     # ------------------------------------------------------------------
     # Metadata del Notebook
@@ -20,82 +266,77 @@ def parse_notebook_header(notebook_path):
     # Keywords: {valor}
     # Descripción: {valor}
     # ------------------------------------------------------------------
-    
+
     Returns:
         dict con los campos extraídos (o valores por defecto si no se encuentran)
     """
-    try:
-        with open(notebook_path, 'r', encoding='utf-8') as f:
-            nb = json.load(f)
-        
-        metadata = {
-            'titulo': '-',
-            'autor': '-',
-            'fecha': '-',
-            'tema': '-',
-            'topico': '-',
-            'keywords': '-',
-            'descripcion': '-'
-        }
-        
-        # Buscar en las primeras celdas (puede ser markdown o code)
-        if 'cells' in nb and len(nb['cells']) > 0:
-            # Buscar en las primeras 3 celdas (por si la primera no es markdown)
-            for cell_idx in range(min(3, len(nb['cells']))):
-                cell = nb['cells'][cell_idx]
-                source = cell.get('source', '')
-                if isinstance(source, list):
-                    source = ''.join(source)
-                
-                # Buscar cada campo con regex (funciona tanto en markdown como en code)
-                patterns = {
-                    'titulo': r'#\s*Título:\s*\{([^}]+)\}',
-                    'autor': r'#\s*Autor:\s*\{([^}]+)\}',
-                    'fecha': r'#\s*Fecha:\s*\{([^}]+)\}',
-                    'tema': r'#\s*Tema:\s*\{([^}]+)\}',
-                    'topico': r'#\s*Tópico:\s*\{([^}]+)\}',
-                    'keywords': r'#\s*Keywords:\s*((?:\{[^}]+\}(?:\s*,\s*)*)+)',  # Captura múltiples {keyword}
-                    'descripcion': r'#\s*Descripción:\s*\{([^}]+)\}'
-                }
-                
-                # Procesar keywords de forma especial (puede tener múltiples {keyword})
-                if metadata['keywords'] == '-':
-                    # Buscar la línea completa de keywords (captura todo hasta el salto de línea)
-                    keywords_line_match = re.search(r'#\s*Keywords:\s*([^\n#]+)', source, re.IGNORECASE | re.MULTILINE)
-                    if keywords_line_match:
-                        keywords_line = keywords_line_match.group(1).strip()
-                        # Extraer todos los valores entre llaves de la línea
-                        keywords_matches = re.findall(r'\{([^}]+)\}', keywords_line)
-                        if keywords_matches:
-                            keywords_clean = [k.strip() for k in keywords_matches if k.strip() and k.strip() != '-']
-                            if keywords_clean:
-                                metadata['keywords'] = ', '.join(keywords_clean)
-                
-                # Procesar otros campos
-                for key, pattern in patterns.items():
-                    if key == 'keywords':
-                        continue  # Ya procesado arriba
-                    if metadata[key] == '-':  # Solo actualizar si no se ha encontrado
-                        match = re.search(pattern, source, re.IGNORECASE | re.MULTILINE)
-                        if match:
-                            value = match.group(1).strip()
-                            if value and value != '-':
-                                metadata[key] = value
-                
-                # Si ya encontramos todos los campos, salir
-                if all(v != '-' for v in metadata.values()):
-                    break
-        
-        return metadata
-    except Exception as e:
-        # Si hay error, devolver valores por defecto
-        return {
-            'titulo': '-',
-            'autor': '-',
-            'fecha': '-',
-            'tema': '-',
-            'topico': '-',
-            'keywords': '-',
-            'descripcion': '-'
+    metadata = _empty_header()
+
+    # Buscar en las primeras 3 celdas (por si la primera no es markdown)
+    for source in sources[:HEADER_CELLS]:
+        # Buscar cada campo con regex (funciona tanto en markdown como en code)
+        patterns = {
+            'titulo': r'#\s*Título:\s*\{([^}]+)\}',
+            'autor': r'#\s*Autor:\s*\{([^}]+)\}',
+            'fecha': r'#\s*Fecha:\s*\{([^}]+)\}',
+            'tema': r'#\s*Tema:\s*\{([^}]+)\}',
+            'topico': r'#\s*Tópico:\s*\{([^}]+)\}',
+            'keywords': r'#\s*Keywords:\s*((?:\{[^}]+\}(?:\s*,\s*)*)+)',  # Captura múltiples {keyword}
+            'descripcion': r'#\s*Descripción:\s*\{([^}]+)\}'
         }
 
+        # Procesar keywords de forma especial (puede tener múltiples {keyword})
+        if metadata['keywords'] == '-':
+            # Buscar la línea completa de keywords (captura todo hasta el salto de línea)
+            keywords_line_match = re.search(r'#\s*Keywords:\s*([^\n#]+)', source, re.IGNORECASE | re.MULTILINE)
+            if keywords_line_match:
+                keywords_line = keywords_line_match.group(1).strip()
+                # Extraer todos los valores entre llaves de la línea
+                keywords_matches = re.findall(r'\{([^}]+)\}', keywords_line)
+                if keywords_matches:
+                    keywords_clean = [k.strip() for k in keywords_matches if k.strip() and k.strip() != '-']
+                    if keywords_clean:
+                        metadata['keywords'] = ', '.join(keywords_clean)
+
+        # Procesar otros campos
+        for key, pattern in patterns.items():
+            if key == 'keywords':
+                continue  # Ya procesado arriba
+            if metadata[key] == '-':  # Solo actualizar si no se ha encontrado
+                match = re.search(pattern, source, re.IGNORECASE | re.MULTILINE)
+                if match:
+                    value = match.group(1).strip()
+                    if value and value != '-':
+                        metadata[key] = value
+
+        # Si ya encontramos todos los campos, salir
+        if all(v != '-' for v in metadata.values()):
+            break
+
+    return metadata
+
+
+def parse_notebook_summary(notebook_path):
+    """
+    Cabecera y metadata ``pe_ctic`` del notebook con una única lectura.
+
+    Returns:
+        (dict de cabecera como parse_notebook_header, dict pe_ctic o None)
+    """
+    try:
+        pe_ctic, sources = read_notebook_head(notebook_path)
+    except Exception:
+        # Fichero vacío, JSON corrupto o ilegible: valores por defecto
+        return _empty_header(), None
+    return parse_header_sources(sources), pe_ctic
+
+
+def parse_notebook_header(notebook_path):
+    """
+    Extrae metadata de la cabecera del notebook (ver ``parse_header_sources``)
+
+    Returns:
+        dict con los campos extraídos (o valores por defecto si no se encuentran)
+    """
+    header, _ = parse_notebook_summary(notebook_path)
+    return header
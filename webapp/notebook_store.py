@@ -0,0 +1,185 @@
+"""
+Persistencia SQLite del catálogo de notebooks, compartida entre workers.
+
+Guarda por notebook los campos de cabecera de ``parse_notebook_header``, el
+propietario y la firma de stat. La base de datos usa WAL: un único proceso
+actualizador escribe (elegido con un ``flock`` sobre ``<db>.lock``) mientras
+el resto de workers leen. Al sobrevivir a reinicios, el arranque en frío solo
+carga filas y re-parsea los notebooks cuya firma haya cambiado.
+"""
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "/app/cache/catalog.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notebooks (
+    full_path   TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    mtime       REAL NOT NULL,
+    size        INTEGER NOT NULL,
+    inode       INTEGER NOT NULL,
+    owner       TEXT NOT NULL,
+    titulo      TEXT NOT NULL,
+    autor       TEXT NOT NULL,
+    fecha       TEXT NOT NULL,
+    tema        TEXT NOT NULL,
+    topico      TEXT NOT NULL,
+    keywords    TEXT NOT NULL,
+    descripcion TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notebooks_mtime ON notebooks (mtime DESC);
+CREATE INDEX IF NOT EXISTS idx_notebooks_autor ON notebooks (autor);
+CREATE INDEX IF NOT EXISTS idx_notebooks_tema ON notebooks (tema);
+CREATE INDEX IF NOT EXISTS idx_notebooks_fecha ON notebooks (fecha);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('generation', 0);
+CREATE TABLE IF NOT EXISTS notebook_views (
+    full_path TEXT PRIMARY KEY,
+    last_view REAL NOT NULL
+);
+"""
+
+_COLUMNS = (
+    "full_path", "path", "filename", "mtime", "size", "inode", "owner",
+    "titulo", "autor", "fecha", "tema", "topico", "keywords", "descripcion",
+)
+
+Signature = tuple[float, int, int]
+
+
+def _row_from_record(record: dict, signature: Signature) -> tuple:
+    mtime, size, inode = signature
+    return (
+        record["full_path"], record["path"], record["filename"], mtime, size, inode,
+        record["owner"], record["title"], record["autor"], record["fecha"],
+        record["tema"], record["topico"], record["keywords"], record["descripcion"],
+    )
+
+
+def _record_from_row(row: sqlite3.Row) -> tuple[dict, Signature]:
+    record = {
+        "title": row["titulo"],
+        "filename": row["filename"],
+        "path": row["path"],
+        "full_path": row["full_path"],
+        "type": "shared",
+        "modified": row["mtime"],
+        "modified_date": datetime.fromtimestamp(row["mtime"]),
+        "owner": row["owner"],
+        "autor": row["autor"],
+        "fecha": row["fecha"],
+        "tema": row["tema"],
+        "topico": row["topico"],
+        "keywords": row["keywords"],
+        "descripcion": row["descripcion"],
+    }
+    return record, (row["mtime"], row["size"], row["inode"])
+
+
+class NotebookStore:
+    """Tabla ``notebooks`` en SQLite (WAL) con una conexión por proceso."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH) -> None:
+        self.db_path = db_path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._lock_fd: int | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Conexión perezosa: se abre tras un posible fork del servidor
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def try_become_updater(self) -> bool:
+        """Intenta ser el único proceso que escribe (flock no bloqueante)."""
+        if self._lock_fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        fd = os.open(self.db_path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def load_all(self) -> list[tuple[dict, Signature]]:
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM notebooks"
+            ).fetchall()
+        return [_record_from_row(row) for row in rows]
+
+    def apply(
+        self,
+        upserts: list[tuple[dict, Signature]],
+        deletes: list[str],
+    ) -> None:
+        """Escribe un lote de cambios en una sola transacción."""
+        if not upserts and not deletes:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                if deletes:
+                    conn.executemany(
+                        "DELETE FROM notebooks WHERE full_path = ?",
+                        [(p,) for p in deletes],
+                    )
+                if upserts:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO notebooks ({', '.join(_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                        [_row_from_record(r, sig) for r, sig in upserts],
+                    )
+                conn.execute(
+                    "UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'"
+                )
+
+    def record_view(self, full_path: str, timestamp: float) -> None:
+        """Última visita de un notebook (prioridad del pre-renderizado)."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO notebook_views (full_path, last_view) VALUES (?, ?)",
+                    (full_path, timestamp),
+                )
+
+    def last_views(self) -> dict[str, float]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT full_path, last_view FROM notebook_views"
+            ).fetchall()
+        return {row["full_path"]: row["last_view"] for row in rows}
+
+    def generation(self) -> int:
+        """Contador que avanza con cada lote de cambios del catálogo.
+
+        Las visitas (``record_view``) no lo tocan, así que no provocan recargas.
+        """
+        with self._lock:
+            return self._connection().execute(
+                "SELECT value FROM catalog_meta WHERE key = 'generation'"
+            ).fetchone()[0]
@@ -0,0 +1,258 @@
+"""
+Vigilancia de /app/shared/notebooks para mantener el catálogo en memoria.
+
+Un hilo en segundo plano escucha inotify (vía ctypes, sin dependencias extra) y
+aplica al catálogo los eventos de creación, escritura, movimiento y borrado.
+Cada ``reconcile_seconds`` se hace además un ``catalog.refresh()`` completo
+como red de seguridad (desbordamiento de la cola de inotify, montajes de red,
+cambios hechos fuera del kernel que vigila). Si inotify no está disponible el
+hilo se limita a esa reconciliación periódica.
+
+Con varios workers, solo uno vigila y escribe en el store SQLite; el resto
+se limitan a seguir sus cambios (ver ``notebook_store``).
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from notebook_catalog import NotebookCatalog
+
+logger = logging.getLogger(__name__)
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY no se vigila: se espera a IN_CLOSE_WRITE para no parsear ficheros a medio escribir
+_WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Envoltorio mínimo sobre las llamadas inotify de libc."""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        # EINVAL si el kernel ya retiró el watch (directorio borrado): se ignora
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> list[tuple[int, int, int, str]]:
+        """Eventos pendientes como (wd, mask, cookie, nombre); [] si vence el timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class NotebookWatcher:
+    """Hilo daemon que aplica cambios del sistema de ficheros al catálogo.
+
+    Con un catálogo persistido solo un proceso (el que obtiene el lock del
+    store) vigila el disco y escribe; los demás siguen a SQLite cada
+    ``follow_seconds`` y toman el relevo si el actualizador desaparece.
+    """
+
+    def __init__(
+        self,
+        catalog: NotebookCatalog,
+        reconcile_seconds: float = 300.0,
+        follow_seconds: float = 2.0,
+    ) -> None:
+        self.catalog = catalog
+        self.reconcile_seconds = reconcile_seconds
+        self.follow_seconds = follow_seconds
+        self._inotify: _Inotify | None = None
+        self._dirs_by_wd: dict[int, str] = {}
+        self._wd_by_dir: dict[str, int] = {}
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def using_inotify(self) -> bool:
+        return self._inotify is not None
+
+    @property
+    def is_updater(self) -> bool:
+        return self.catalog.writable
+
+    def start(self) -> None:
+        """Carga inicial síncrona del catálogo y arranque del hilo (idempotente)."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.catalog.load_from_store()
+            if self.catalog.store is None or self._try_become_updater():
+                self._start_updating()
+            self._thread = threading.Thread(
+                target=self._run, name="notebook-watcher", daemon=True
+            )
+            self._thread.start()
+
+    def _try_become_updater(self) -> bool:
+        try:
+            return self.catalog.store.try_become_updater()
+        except OSError as exc:
+            logger.warning("No se pudo usar el lock del catálogo: %s", exc)
+            return False
+
+    def _start_updating(self) -> None:
+        self.catalog.writable = True
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as exc:
+            logger.warning("inotify no disponible (%s); solo reconciliación periódica", exc)
+            self._inotify = None
+        if self._inotify is not None:
+            self._watch_tree(self.catalog.root)
+        self.catalog.refresh()
+
+    def _run(self) -> None:
+        while not self.is_updater:
+            time.sleep(self.follow_seconds)
+            try:
+                if self._try_become_updater():
+                    logger.info("Este proceso pasa a actualizar el catálogo")
+                    self._start_updating()
+                else:
+                    self.catalog.sync_from_store()
+            except Exception:
+                logger.exception("Error sincronizando el catálogo")
+
+        next_reconcile = time.monotonic() + self.reconcile_seconds
+        while True:
+            timeout = max(0.0, next_reconcile - time.monotonic())
+            try:
+                if self._inotify is not None:
+                    for event in self._inotify.read_events(timeout):
+                        self._handle_event(*event)
+                else:
+                    time.sleep(timeout)
+                if time.monotonic() >= next_reconcile:
+                    self._reconcile()
+                    next_reconcile = time.monotonic() + self.reconcile_seconds
+            except Exception:
+                logger.exception("Error en el vigilante de notebooks")
+                time.sleep(1.0)
+
+    def _reconcile(self) -> None:
+        if self._inotify is not None and not self._wd_by_dir:
+            # El directorio raíz pudo no existir al arrancar
+            self._watch_tree(self.catalog.root)
+        self.catalog.refresh()
+
+    def _handle_event(self, wd: int, mask: int, cookie: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("Cola inotify desbordada; reconciliando catálogo")
+            self._reconcile()
+            return
+        directory = self._dirs_by_wd.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self._forget_dir(directory)
+            if directory == self.catalog.root:
+                self.catalog.remove_tree(directory)
+            return
+
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if name == ".ipynb_checkpoints":
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path)
+                self.catalog.update_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._forget_tree(path)
+                self.catalog.remove_tree(path)
+            return
+
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            self.catalog.remove_path(path)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self.catalog.update_path(path)
+
+    def _watch_tree(self, root: str) -> None:
+        for current, dirs, _files in os.walk(root):
+            dirs[:] = [d for d in dirs if d != ".ipynb_checkpoints"]
+            if current in self._wd_by_dir:
+                continue
+            try:
+                wd = self._inotify.add_watch(current, _WATCH_MASK | IN_ONLYDIR)
+            except OSError as exc:
+                logger.warning("No se pudo vigilar %s: %s", current, exc)
+                continue
+            self._dirs_by_wd[wd] = current
+            self._wd_by_dir[current] = wd
+
+    def _forget_dir(self, directory: str) -> None:
+        wd = self._wd_by_dir.pop(directory, None)
+        if wd is not None:
+            self._dirs_by_wd.pop(wd, None)
+
+    def _forget_tree(self, directory: str) -> None:
+        # El kernel retira los watches de directorios borrados (IN_IGNORED);
+        # en un movimiento hacia fuera del árbol los olvidamos nosotros.
+        prefix = directory.rstrip("/") + "/"
+        for path in [p for p in self._wd_by_dir if p == directory or p.startswith(prefix)]:
+            wd = self._wd_by_dir[path]
+            self._forget_dir(path)
+            self._inotify.rm_watch(wd)
@@ -0,0 +1,243 @@
+"""
+Pre-renderizado en segundo plano del HTML de los notebooks compartidos.
+
+Cuando el catálogo detecta un notebook nuevo o modificado, se encola para
+renderizarlo (con el mismo ``convert_notebook_to_html`` que usa la vista) en
+un pool de hilos y publicarlo en la caché de renders, cuyo almacén en disco
+escribe de forma atómica. Así ``view_notebook()`` casi siempre encuentra el
+HTML hecho. La cola es de prioridad: primero los notebooks vistos más
+recientemente.
+
+Solo el proceso actualizador del catálogo (ver ``notebook_store``) trabaja la
+cola; su estado se publica en ``status_path`` para que cualquier worker pueda
+servirlo.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from notebook_catalog import NotebookCatalog
+from render_cache import RenderCache, _atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Una visita se persiste como mucho una vez por intervalo y notebook
+_VIEW_PERSIST_SECONDS = 60.0
+
+
+class PrerenderPipeline:
+    """Cola de prioridad + pool de hilos que calientan ``RenderCache``."""
+
+    def __init__(
+        self,
+        catalog: NotebookCatalog,
+        cache: RenderCache,
+        render: Callable[[str, str], str],
+        render_key: Callable[[str, os.stat_result, str], tuple],
+        prefixes: list[str],
+        workers: int = 1,
+        status_path: str | None = None,
+    ) -> None:
+        self.catalog = catalog
+        self.cache = cache
+        self.render = render
+        self.render_key = render_key
+        self.prefixes = prefixes
+        self.workers = max(1, workers)
+        self.status_path = status_path
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, str]] = []
+        self._queued: dict[str, tuple[float, int]] = {}
+        self._seq = itertools.count()
+        self._in_progress: set[str] = set()
+        self._views: dict[str, float] = {}
+        self._views_persisted: dict[str, float] = {}
+        self._seeded = False
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._last_status_write = 0.0
+        self.rendered = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_error: str | None = None
+        catalog.add_listener(self._on_catalog_change)
+
+    # --- prioridades -------------------------------------------------------
+
+    def note_view(self, full_path: str) -> None:
+        """Registra una visita: sube la prioridad del notebook en la cola."""
+        now = time.time()
+        with self._cond:
+            self._views[full_path] = now
+            if full_path in self._queued:
+                self._push(full_path, -now)
+                self._cond.notify()
+        store = self.catalog.store
+        if store is not None and now - self._views_persisted.get(full_path, 0.0) > _VIEW_PERSIST_SECONDS:
+            # Las visitas de otros workers llegan al actualizador a través del store
+            self._views_persisted[full_path] = now
+            try:
+                store.record_view(full_path, now)
+            except sqlite3.Error as exc:
+                logger.debug("No se pudo registrar la visita: %s", exc)
+
+    def _last_views(self) -> dict[str, float]:
+        views = {}
+        store = self.catalog.store
+        if store is not None:
+            try:
+                views.update(store.last_views())
+            except sqlite3.Error as exc:
+                logger.debug("No se pudieron leer las visitas: %s", exc)
+        with self._cond:
+            for full_path, ts in self._views.items():
+                views[full_path] = max(ts, views.get(full_path, 0.0))
+        return views
+
+    # --- cola --------------------------------------------------------------
+
+    def _push(self, full_path: str, priority: float) -> None:
+        # Llamar con self._cond tomado. Las entradas antiguas del heap se descartan al sacarlas.
+        current = self._queued.get(full_path)
+        if current is not None and current[0] <= priority:
+            return
+        entry = (priority, next(self._seq))
+        self._queued[full_path] = entry
+        heapq.heappush(self._heap, (entry[0], entry[1], full_path))
+
+    def enqueue(self, paths: list[str]) -> None:
+        if not paths:
+            return
+        views = self._last_views()
+        with self._cond:
+            for full_path in paths:
+                # Nunca vistos: prioridad 0, detrás de cualquier notebook visitado
+                self._push(full_path, -views.get(full_path, 0.0))
+            self._cond.notify_all()
+
+    def _on_catalog_change(self, changed: list[str], deleted: list[str]) -> None:
+        if not self.catalog.writable:
+            return
+        with self._cond:
+            for full_path in deleted:
+                self._queued.pop(full_path, None)
+        self.enqueue(changed)
+
+    def _seed(self) -> None:
+        """Al pasar a actualizador: encolar todo el catálogo (lo ya cacheado se salta)."""
+        self._seeded = True
+        self.enqueue([record["full_path"] for record in self.catalog.records()])
+
+    def _next(self) -> str | None:
+        with self._cond:
+            while True:
+                while self._heap:
+                    priority, seq, full_path = heapq.heappop(self._heap)
+                    if self._queued.get(full_path) == (priority, seq):
+                        del self._queued[full_path]
+                        self._in_progress.add(full_path)
+                        return full_path
+                self._cond.wait(timeout=5.0)
+                if not self._seeded and self.catalog.writable:
+                    return None
+
+    # --- trabajo -----------------------------------------------------------
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"prerender-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self) -> None:
+        while True:
+            if not self._seeded and self.catalog.writable:
+                with self._start_lock:
+                    if not self._seeded:
+                        self._seed()
+            full_path = self._next()
+            if full_path is None:
+                continue
+            try:
+                self._render_all(full_path)
+            except Exception as exc:
+                with self._cond:
+                    self.failed += 1
+                    self.last_error = f"{full_path}: {exc}"
+                logger.warning("Pre-render fallido %s: %s", full_path, exc)
+            finally:
+                with self._cond:
+                    self._in_progress.discard(full_path)
+                self._write_status()
+
+    def _render_all(self, full_path: str) -> None:
+        try:
+            stat_info = os.stat(full_path)
+        except OSError:
+            return
+        for prefix in self.prefixes:
+            key = self.render_key(full_path, stat_info, prefix)
+            if key is None:
+                # Se sirve en streaming sin pasar por la caché
+                return
+            rendered = self.cache.warm(key, lambda: self.render(full_path, prefix))
+            with self._cond:
+                if rendered:
+                    self.rendered += 1
+                else:
+                    self.skipped += 1
+
+    # --- estado ------------------------------------------------------------
+
+    def status(self) -> dict:
+        """Estado de la cola; en workers que no la procesan se lee el último publicado."""
+        if not self.catalog.writable and self.status_path:
+            try:
+                with open(self.status_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                data["served_by"] = "follower"
+                return data
+            except (OSError, ValueError):
+                pass
+        with self._cond:
+            backlog = sorted(self._queued.items(), key=lambda item: item[1])
+            return {
+                "active": self.catalog.writable,
+                "workers": self.workers,
+                "queued": len(backlog),
+                "in_progress": sorted(self._in_progress),
+                "next": [full_path for full_path, _ in backlog[:20]],
+                "rendered": self.rendered,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "last_error": self.last_error,
+                "updated": time.time(),
+                "served_by": "updater" if self.catalog.writable else "memory",
+            }
+
+    def _write_status(self, force: bool = False) -> None:
+        if not self.status_path or not self.catalog.writable:
+            return
+        now = time.monotonic()
+        with self._cond:
+            # Como mucho una escritura por segundo, salvo al vaciarse la cola
+            if not force and self._queued and now - self._last_status_write < 1.0:
+                return
+            self._last_status_write = now
+        try:
+            _atomic_write(self.status_path, json.dumps(self.status()).encode("utf-8"))
+        except OSError as exc:
+            logger.debug("No se pudo publicar el estado del pre-render: %s", exc)
@@ -0,0 +1,203 @@
+"""
+Perfiles de peticiones lentas: cProfile bajo demanda y muestreo automático.
+
+- ``ProfileSession``: cProfile de una sola petición (la activa un administrador
+  con ``?profile=1``). Se guarda como ``<id>.prof`` (formato de ``pstats``,
+  legible con ``python -m pstats`` o snakeviz) y ``<id>.txt`` (resumen por
+  tiempo acumulado).
+- ``StackSampler``: un hilo toma cada ``interval`` segundos la pila de los hilos
+  con peticiones en curso. Si una petición supera el umbral, sus pilas se
+  guardan en ``<id>.folded`` (formato de flamegraph.pl y speedscope), donde se
+  ve qué celdas, filtros o preprocesadores de nbconvert ocupan el tiempo.
+
+Cada artefacto lleva un ``<id>.json`` con la ruta, la duración y el tipo.
+``ProfileStore`` conserva solo los ``keep`` más recientes.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from render_cache import _atomic_write
+
+_ARTIFACT_NAME = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}-(profile|slow)\.(prof|txt|folded|json)$")
+# De una pila más profunda se descartan los marcos más externos (gunicorn, werkzeug)
+_MAX_STACK_DEPTH = 96
+_SUMMARY_LINES = 60
+
+
+class ProfileStore:
+    """Artefactos de perfilado en ``root``; conserva los ``keep`` más recientes."""
+
+    def __init__(self, root: str, keep: int = 50) -> None:
+        self.root = root
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path_for(self, name: str) -> str | None:
+        """Ruta de ``name`` o None si el nombre no es de un artefacto."""
+        if not _ARTIFACT_NAME.match(name):
+            return None
+        return os.path.join(self.root, name)
+
+    def save(self, kind: str, meta: dict, files: dict[str, bytes]) -> str:
+        """Guarda ``files`` (extensión -> bytes) y ``meta``; devuelve el id."""
+        artifact_id = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}-{kind}"
+        meta = dict(meta, id=artifact_id, kind=kind, created=time.time(), files=[
+            f"{artifact_id}.{ext}" for ext in files
+        ])
+        for ext, data in files.items():
+            _atomic_write(os.path.join(self.root, f"{artifact_id}.{ext}"), data)
+        _atomic_write(
+            os.path.join(self.root, f"{artifact_id}.json"),
+            json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"),
+        )
+        self._prune()
+        return artifact_id
+
+    def list(self) -> list[dict]:
+        """Metadatos de los artefactos, del más reciente al más antiguo."""
+        items = []
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        for name in names:
+            if not name.endswith(".json") or not _ARTIFACT_NAME.match(name):
+                continue
+            try:
+                with open(os.path.join(self.root, name), "r", encoding="utf-8") as f:
+                    items.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        items.sort(key=lambda item: item.get("created", 0), reverse=True)
+        return items
+
+    def _prune(self) -> None:
+        with self._lock:
+            for meta in self.list()[self.keep:]:
+                for name in meta.get("files", []) + [f"{meta['id']}.json"]:
+                    path = self.path_for(name)
+                    if path is None:
+                        continue
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+
+
+class ProfileSession:
+    """cProfile de la petición en curso (solo del hilo que la atiende).
+
+    Solo puede haber una a la vez por proceso: ``start`` devuelve None si ya
+    hay otra activa.
+    """
+
+    _active = threading.Lock()
+
+    def __init__(self) -> None:
+        self.profile = cProfile.Profile()
+        self.started = 0.0
+
+    @classmethod
+    def start(cls) -> "ProfileSession | None":
+        if not cls._active.acquire(blocking=False):
+            return None
+        session = cls()
+        session.started = time.perf_counter()
+        try:
+            session.profile.enable()
+        except BaseException:
+            cls._active.release()
+            raise
+        return session
+
+    def stop(self) -> tuple[float, dict[str, bytes]]:
+        """Duración y ficheros ``prof``/``txt`` del perfil."""
+        try:
+            self.profile.disable()
+        finally:
+            self._active.release()
+        duration = time.perf_counter() - self.started
+        self.profile.create_stats()
+        # Lo mismo que escribe pstats.Stats.dump_stats (antes de Stats(), que vacía profile.stats)
+        raw = marshal.dumps(self.profile.stats)
+        summary = io.StringIO()
+        pstats.Stats(self.profile, stream=summary).sort_stats("cumulative").print_stats(_SUMMARY_LINES)
+        return duration, {"prof": raw, "txt": summary.getvalue().encode("utf-8")}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Muestreo periódico de las pilas de los hilos registrados con ``begin``.
+
+    El hilo de muestreo solo despierta mientras hay peticiones en curso.
+    """
+
+    def __init__(self, interval: float = 0.02) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._samples: dict[int, Counter] = {}
+        self._thread: threading.Thread | None = None
+
+    def begin(self, ident: int) -> None:
+        with self._lock:
+            self._samples[ident] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self._thread.start()
+        self._wake.set()
+
+    def end(self, ident: int) -> Counter:
+        """Pilas muestreadas del hilo ``ident`` (raíz primero) con su número de muestras."""
+        with self._lock:
+            return self._samples.pop(ident, Counter())
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._samples:
+                    self._wake.clear()
+                    continue
+                idents = list(self._samples)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None or ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                with self._lock:
+                    samples = self._samples.get(ident)
+                    if samples is not None:
+                        samples[";".join(stack)] += 1
+            del frames
+
+
+def folded(samples: Counter) -> bytes:
+    """Pilas en formato «folded» (``marco;marco;marco N`` por línea)."""
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common()).encode("utf-8")
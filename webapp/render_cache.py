@@ -0,0 +1,433 @@
+"""
+Caché de HTML renderizado de notebooks: LRU en memoria delante de un almacén en disco.
+
+La clave la decide quien llama (p. ej. ``(ruta, mtime, tamaño, prefijo)``); el
+disco es direccionable por contenido: ``blobs/<sha256 del HTML>`` guarda cada
+render una sola vez y ``keys/<sha256 de la clave>`` apunta al blob. Ambos
+niveles se acotan por bytes totales y expulsan lo usado hace más tiempo. En
+disco cuentan blobs, variantes y claves; la expulsión se hace con un ``flock``
+sobre ``.evict.lock`` y tras volver a medir el directorio, porque lo comparten
+todos los workers, y borra también las claves de los blobs expulsados. Si
+varias peticiones fallan a la vez para la misma clave, solo una renderiza y el
+resto espera su resultado.
+
+Con ``compress=True`` cada entrada guarda además sus variantes gzip/brotli,
+generadas una sola vez al construirla (en disco, junto al blob con extensión
+``.gz``/``.br``).
+
+``get_entry`` admite ``validate``: una entrada (de memoria o de disco) para la
+que devuelve False se descarta y se vuelve a renderizar, p. ej. si le falta
+alguna de las imágenes que referencia.
+
+``observer`` (opcional) recibe el resultado de cada consulta: ``"memory"``,
+``"disk"``, ``"inflight"`` (esperó al render de otra petición) o ``"miss"``.
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from compression import (
+    MIN_COMPRESS_BYTES, SUFFIXES, available_encodings, compress, compress_variants,
+)
+
+logger = logging.getLogger(__name__)
+
+# Marca vacía junto al blob (``<blob>.gz.none``): esa variante no ocupa menos
+# que el original y no se vuelve a intentar en cada lectura
+_NO_VARIANT = ".none"
+
+# Cada cuánto vuelve un worker a medir el disco aunque su cuenta no supere el
+# límite: los demás workers también escriben
+_DISK_RESCAN_SECONDS = 60.0
+
+
+def _key_digest(key: tuple) -> str:
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """Publica ``data`` en ``path`` de forma atómica (temporal + rename)."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class RenderedEntry:
+    """Contenido en UTF-8 y sus variantes comprimidas (codificación -> bytes).
+
+    ``assets`` lo rellena quien valida la entrada (imágenes de ``/assets`` que
+    referencia), para no volver a buscarlas en cada acierto.
+    """
+
+    __slots__ = ("data", "variants", "assets")
+
+    def __init__(self, data: bytes, variants: dict[str, bytes] | None = None) -> None:
+        self.data = data
+        self.variants = variants or {}
+        self.assets: tuple[str, ...] | None = None
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + sum(len(v) for v in self.variants.values())
+
+    def text(self) -> str:
+        return self.data.decode("utf-8")
+
+
+class _Inflight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: RenderedEntry | None = None
+        self.error: BaseException | None = None
+
+
+class RenderCache:
+    """LRU en memoria + almacén en disco por contenido, con renders de un solo vuelo."""
+
+    def __init__(
+        self,
+        cache_dir: str | None,
+        memory_bytes: int = 256 * 1024 * 1024,
+        disk_bytes: int = 2 * 1024 * 1024 * 1024,
+        compress: bool = False,
+        observer: Callable[[str], None] | None = None,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.compress = compress
+        self.observer = observer
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, RenderedEntry] = OrderedDict()
+        self._memory_used = 0
+        self._inflight: dict[str, _Inflight] = {}
+        # blob -> (bytes con variantes, último uso); se carga del disco la primera vez
+        self._blobs: dict[str, tuple[int, float]] | None = None
+        self._disk_used = 0
+        self._scanned_at = 0.0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _observe(self, result: str) -> None:
+        if self.observer is not None:
+            try:
+                self.observer(result)
+            except Exception:
+                logger.exception("Error en el observador de la caché")
+
+    def _build(self, value: str) -> RenderedEntry:
+        data = value.encode("utf-8")
+        return RenderedEntry(data, compress_variants(data) if self.compress else None)
+
+    # --- memoria -----------------------------------------------------------
+
+    def _memory_get(self, digest: str) -> RenderedEntry | None:
+        entry = self._memory.get(digest)
+        if entry is not None:
+            self._memory.move_to_end(digest)
+        return entry
+
+    def _memory_put(self, digest: str, entry: RenderedEntry) -> None:
+        size = entry.size
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(digest, None)
+        if old is not None:
+            self._memory_used -= old.size
+        self._memory[digest] = entry
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted.size
+
+    # --- disco -------------------------------------------------------------
+
+    def _blob_path(self, blob: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", blob[:2], blob)
+
+    def _key_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "keys", digest[:2], digest)
+
+    def _scan_disk(self) -> tuple[dict[str, tuple[int, float]], int]:
+        """Blobs en disco (bytes con variantes, último uso) y bytes totales, claves incluidas."""
+        blobs: dict[str, tuple[int, float]] = {}
+        used = 0
+        for kind in ("blobs", "keys"):
+            for current, _dirs, files in os.walk(os.path.join(self.cache_dir, kind)):
+                for name in files:
+                    if name.startswith(".tmp-"):
+                        continue
+                    try:
+                        st = os.stat(os.path.join(current, name))
+                    except OSError:
+                        continue
+                    used += st.st_size
+                    if kind == "blobs":
+                        # Las variantes (<blob>.gz, <blob>.br) cuentan con su blob
+                        blob = name.split(".", 1)[0]
+                        size, last = blobs.get(blob, (0, 0.0))
+                        blobs[blob] = (size + st.st_size, max(last, st.st_mtime))
+        return blobs, used
+
+    def _load_blob_index(self) -> None:
+        if self._blobs is not None:
+            return
+        self._blobs, self._disk_used = self._scan_disk()
+        self._scanned_at = time.monotonic()
+
+    def _disk_get(self, digest: str) -> RenderedEntry | None:
+        try:
+            with open(self._key_path(digest), "r", encoding="ascii") as f:
+                blob = f.read().strip()
+            path = self._blob_path(blob)
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            # Marca de uso para la expulsión LRU del disco
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            if self._blobs is not None and blob in self._blobs:
+                self._blobs[blob] = (self._blobs[blob][0], time.time())
+        entry = RenderedEntry(data)
+        if self.compress:
+            self._disk_get_variants(blob, entry)
+        return entry
+
+    def _disk_get_variants(self, blob: str, entry: RenderedEntry) -> None:
+        if len(entry.data) < MIN_COMPRESS_BYTES:
+            return
+        path = self._blob_path(blob)
+        for encoding in available_encodings():
+            variant = path + SUFFIXES[encoding]
+            try:
+                with open(variant, "rb") as f:
+                    entry.variants[encoding] = f.read()
+                continue
+            except OSError:
+                pass
+            if os.path.exists(variant + _NO_VARIANT):
+                continue
+            # Blob escrito sin esta variante (antes de activar la compresión o sin brotli)
+            compressed = compress(entry.data, encoding)
+            try:
+                if len(compressed) >= len(entry.data):
+                    _atomic_write(variant + _NO_VARIANT, b"")
+                    continue
+                entry.variants[encoding] = compressed
+                _atomic_write(variant, compressed)
+            except OSError:
+                pass
+
+    def _disk_has(self, digest: str) -> bool:
+        try:
+            with open(self._key_path(digest), "r", encoding="ascii") as f:
+                blob = f.read().strip()
+        except OSError:
+            return False
+        return os.path.exists(self._blob_path(blob))
+
+    def _disk_put(self, digest: str, entry: RenderedEntry) -> None:
+        with self._lock:
+            # El índice se mide antes de escribir, para no contar dos veces lo nuevo
+            self._load_blob_index()
+        blob = hashlib.sha256(entry.data).hexdigest()
+        path = self._blob_path(blob)
+        added = 0
+        if not os.path.exists(path):
+            for encoding, compressed in entry.variants.items():
+                _atomic_write(path + SUFFIXES[encoding], compressed)
+            if self.compress and len(entry.data) >= MIN_COMPRESS_BYTES:
+                for encoding in available_encodings():
+                    if encoding not in entry.variants:
+                        _atomic_write(path + SUFFIXES[encoding] + _NO_VARIANT, b"")
+            # El blob se publica el último: si existe, sus variantes ya están
+            _atomic_write(path, entry.data)
+            added += entry.size
+        key_path = self._key_path(digest)
+        if not os.path.exists(key_path):
+            added += len(blob)
+        _atomic_write(key_path, blob.encode("ascii"))
+        with self._lock:
+            # Solo cuentan los ficheros nuevos (no los reescritos ni los de otros workers)
+            self._disk_used += added
+            self._blobs[blob] = (entry.size, time.time())
+            evict = (
+                self._disk_used > self.disk_bytes
+                or time.monotonic() - self._scanned_at > _DISK_RESCAN_SECONDS
+            )
+        if evict:
+            self._evict(keep=blob)
+
+    def _evict(self, keep: str) -> None:
+        """Vuelve a medir el disco y expulsa blobs (LRU) hasta quedar por debajo del límite."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.cache_dir, ".evict.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Un solo proceso mide y expulsa a la vez; los demás esperan y ven su resultado
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            blobs, used = self._scan_disk()
+            victims = set()
+            if used > self.disk_bytes:
+                for name, (size, _last) in sorted(blobs.items(), key=lambda item: item[1][1]):
+                    if used <= self.disk_bytes:
+                        break
+                    if name == keep:
+                        continue
+                    victims.add(name)
+                    used -= size
+                for name in victims:
+                    del blobs[name]
+                    victim = self._blob_path(name)
+                    variants = [victim + suffix for suffix in SUFFIXES.values()]
+                    for path in (victim, *variants, *(v + _NO_VARIANT for v in variants)):
+                        try:
+                            os.unlink(path)
+                        except OSError:
+                            pass
+                used -= self._sweep_keys(blobs)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._blobs = blobs
+            self._disk_used = used
+            self._scanned_at = time.monotonic()
+
+    def _sweep_keys(self, blobs: dict[str, tuple[int, float]]) -> int:
+        """Borra las claves cuyo blob ya no existe; devuelve los bytes liberados."""
+        freed = 0
+        for current, _dirs, files in os.walk(os.path.join(self.cache_dir, "keys")):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(current, name)
+                try:
+                    with open(path, "r", encoding="ascii") as f:
+                        blob = f.read().strip()
+                    if blob in blobs:
+                        continue
+                    size = os.path.getsize(path)
+                    os.unlink(path)
+                    freed += size
+                except (OSError, UnicodeError):
+                    continue
+        return freed
+
+    # --- API ---------------------------------------------------------------
+
+    def warm(self, key: tuple, render: Callable[[], str]) -> bool:
+        """Renderiza ``key`` si no está en ningún nivel; True si ha hecho falta."""
+        digest = _key_digest(key)
+        with self._lock:
+            if digest in self._memory:
+                return False
+        if self.cache_dir and self._disk_has(digest):
+            return False
+        # Los renders de fondo no cuentan como fallos de las peticiones
+        self._get_entry(key, render, observe=lambda result: None)
+        return True
+
+    def get_or_render(self, key: tuple, render: Callable[[], str]) -> str:
+        """HTML para ``key``; llama a ``render`` solo si no está en ningún nivel."""
+        return self.get_entry(key, render).text()
+
+    def get_entry(
+        self,
+        key: tuple,
+        render: Callable[[], str],
+        validate: Callable[[RenderedEntry], bool] | None = None,
+    ) -> RenderedEntry:
+        """Como ``get_or_render``, pero con los bytes y sus variantes comprimidas."""
+        return self._get_entry(key, render, self._observe, validate)
+
+    def _get_entry(
+        self,
+        key: tuple,
+        render: Callable[[], str],
+        observe: Callable[[str], None],
+        validate: Callable[[RenderedEntry], bool] | None = None,
+    ) -> RenderedEntry:
+        digest = _key_digest(key)
+        stale = False
+        if validate is not None:
+            with self._lock:
+                entry = self._memory.get(digest)
+            if entry is not None and not validate(entry):
+                # El disco guarda el mismo contenido: tampoco sirve
+                stale = True
+                with self._lock:
+                    if self._memory.get(digest) is entry:
+                        del self._memory[digest]
+                        self._memory_used -= entry.size
+        with self._lock:
+            entry = self._memory_get(digest)
+            if entry is not None:
+                self.hits += 1
+            else:
+                inflight = self._inflight.get(digest)
+                owner = inflight is None
+                if owner:
+                    inflight = _Inflight()
+                    self._inflight[digest] = inflight
+        if entry is not None:
+            observe("memory")
+            return entry
+
+        if not owner:
+            observe("inflight")
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.value
+
+        try:
+            entry = self._disk_get(digest) if self.cache_dir and not stale else None
+            if entry is not None and validate is not None and not validate(entry):
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                observe("disk")
+            else:
+                with self._lock:
+                    self.misses += 1
+                observe("miss")
+                entry = self._build(render())
+                if self.cache_dir:
+                    try:
+                        self._disk_put(digest, entry)
+                    except OSError as exc:
+                        logger.warning("No se pudo guardar el render en disco: %s", exc)
+            with self._lock:
+                self._memory_put(digest, entry)
+            inflight.value = entry
+            return entry
+        except BaseException as exc:
+            inflight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+            inflight.done.set()
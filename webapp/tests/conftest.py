@@ -0,0 +1,5 @@
+"""Los módulos de la webapp se importan como en el contenedor (desde ``webapp/``)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,99 @@
+"""Imágenes extraídas y caché de renders: una página cacheada nunca apunta a una imagen borrada."""
+from __future__ import annotations
+
+import base64
+import hashlib
+import os
+
+from asset_store import AssetStore
+from render_cache import RenderCache
+
+IMAGE_BYTES = 4096
+
+
+def _page(seed: int) -> str:
+    data = bytes([seed]) * IMAGE_BYTES
+    return f'<img src="data:image/png;base64,{base64.b64encode(data).decode("ascii")}">'
+
+
+def _name(seed: int) -> str:
+    return f"{hashlib.sha256(bytes([seed]) * IMAGE_BYTES).hexdigest()}.png"
+
+
+def _age(store: AssetStore, seconds: float) -> None:
+    """Envejece todas las imágenes (como si llevaran tiempo sin usarse)."""
+    for current, _dirs, files in os.walk(store.root):
+        for name in files:
+            path = os.path.join(current, name)
+            st = os.stat(path)
+            os.utime(path, (st.st_atime - seconds, st.st_mtime - seconds))
+
+
+def _missing(store: AssetStore, html: str) -> list[str]:
+    names = [part.split('"', 1)[0] for part in html.split("/assets/")[1:]]
+    return [name for name in names if not os.path.exists(store.path_for(name))]
+
+
+def test_store_stays_within_budget(tmp_path):
+    store = AssetStore(str(tmp_path / "assets"), max_bytes=5 * IMAGE_BYTES)
+    for seed in range(20):
+        store.put(bytes([seed]) * IMAGE_BYTES, "png")
+    used = sum(
+        os.path.getsize(os.path.join(current, name))
+        for current, _dirs, files in os.walk(store.root)
+        for name in files
+        if name.endswith(".png")
+    )
+    assert used <= store.max_bytes
+
+
+def test_cached_page_is_rerendered_when_its_image_was_evicted(tmp_path):
+    store = AssetStore(str(tmp_path / "assets"), max_bytes=3 * IMAGE_BYTES)
+    cache = RenderCache(str(tmp_path / "render"), memory_bytes=1024 * 1024)
+    renders = []
+
+    def render(seed: int):
+        def build() -> str:
+            renders.append(seed)
+            return store.extract_images(_page(seed), "/assets")
+        return build
+
+    first = cache.get_entry(("page", 0), render(0), validate=store.present).text()
+    assert _missing(store, first) == []
+
+    # Otras páginas llenan el almacén por encima del límite: la imagen de la primera se expulsa
+    _age(store, 7200)
+    for seed in range(1, 6):
+        cache.get_entry(("page", seed), render(seed), validate=store.present)
+    assert _missing(store, first)
+
+    # Desde memoria: se detecta la imagen que falta y se vuelve a renderizar
+    served = cache.get_entry(("page", 0), render(0), validate=store.present).text()
+    assert renders.count(0) == 2
+    assert _missing(store, served) == []
+
+    # Desde disco (otro worker, sin la entrada en memoria)
+    _age(store, 7200)
+    for seed in range(6, 10):
+        cache.get_entry(("page", seed), render(seed), validate=store.present)
+    other = RenderCache(str(tmp_path / "render"), memory_bytes=1024 * 1024)
+    served = other.get_entry(("page", 0), render(0), validate=store.present).text()
+    assert renders.count(0) == 3
+    assert _missing(store, served) == []
+
+
+def test_cache_hits_keep_their_images(tmp_path):
+    store = AssetStore(str(tmp_path / "assets"), max_bytes=3 * IMAGE_BYTES)
+    cache = RenderCache(str(tmp_path / "render"), memory_bytes=1024 * 1024)
+    page = cache.get_entry(
+        ("page", 0), lambda: store.extract_images(_page(0), "/assets"), validate=store.present
+    ).text()
+    for seed in (1, 2):
+        store.put(bytes([seed]) * IMAGE_BYTES, "png")
+    _age(store, 7200)
+    # Un acierto renueva la marca de uso de sus imágenes: se expulsan antes las demás
+    cache.get_entry(("page", 0), lambda: "", validate=store.present)
+    for seed in (3, 4):
+        store.put(bytes([seed]) * IMAGE_BYTES, "png")
+    assert _missing(store, page) == []
+    assert not os.path.exists(store.path_for(_name(1)))